@@ -0,0 +1,74 @@
+"""Measure the import time of the package modules with ``python -X importtime`` in a fresh
+interpreter and check it against a budget. Heavy dependencies (pandas, numpy, yaml,
+requests) must not be imported at all: they are loaded on the code paths which need them.
+Exits with status 1 if the budget is exceeded or a heavy dependency is imported, so it can
+run as a check in CI.
+
+Usage:
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --budget-ms 100 --runs 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example_pkg')
+
+MODULES = ['shopify', 'graphql', 'rest', 'async_shopify', 'queries', 'metafields', 'batch',
+           'bulk_operation', 'sharding', 'checkpoint', 'id_cache', 'jobs', 'records', 'sinks',
+           'stores', 'transport', 'metrics']
+
+HEAVY = ['pandas', 'numpy', 'yaml', 'requests', 'pyarrow']
+
+BUDGET_MS = 150.0
+
+def import_times(modules):
+    """Import ``modules`` in a fresh interpreter
+
+    Returns:
+        tuple: ``(times, total)``; cumulative import time in microseconds by module for
+        every imported module, and the total of the modules of the import statement
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+                            cwd=PACKAGE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode:
+        sys.exit(result.stderr)
+    times, total = {}, 0
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+        # not indented: imported by the import statement, includes its nested imports
+        if name[1:2] != ' ' and name.strip() in modules:
+            total += int(cumulative)
+    return times, total
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help='max. import time of all package modules')
+    parser.add_argument('--runs', type=int, default=3, help='the fastest run is compared to the budget')
+    args = parser.parse_args()
+
+    times, total = min((import_times(MODULES) for _ in range(args.runs)), key=lambda run: run[1])
+    total = total / 1000
+    for module in MODULES:
+        print('{:<28} {:>8.1f} ms'.format(module, times.get(module, 0) / 1000))
+    print('{:<28} {:>8.1f} ms (budget {:.1f} ms)'.format('total', total, args.budget_ms))
+
+    failed = False
+    heavy = sorted(name for name in HEAVY if name in times)
+    if heavy:
+        print('heavy dependencies imported at startup: {}'.format(', '.join(heavy)))
+        failed = True
+    if total > args.budget_ms:
+        print('import time exceeds the budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
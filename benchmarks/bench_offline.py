@@ -0,0 +1,122 @@
+"""Offline benchmark suite on top of ``transport.ReplayTransport``: GraphQL pagination,
+batched metafield mutations and CSV-to-metafield conversion. Runs on synthetic
+exchanges by default, or on a recording of ``transport.RecordingTransport``.
+
+Usage:
+
+    python benchmarks/bench_offline.py --pages 200 --latency 0.01
+    python benchmarks/bench_offline.py --fixture fixtures/products.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example_pkg'))
+
+from transport import ReplayTransport
+from graphql import GraphQL
+from batch import MetafieldBatchPipeline
+from stores import Store
+from throttle import CostBucket
+
+URL = 'https://bench.myshopify.com/admin/api/2021-01/graphql.json'
+HEADERS = {'content-type': 'application/json'}
+STORE = Store('bench', 'password', '2021-01')
+
+def cost(requested):
+    return {'cost': {'requestedQueryCost': requested, 'actualQueryCost': requested,
+                     'throttleStatus': {'maximumAvailable': 1000.0, 'currentlyAvailable': 1000,
+                                        'restoreRate': 50.0}}}
+
+def products_exchanges(pages, edges):
+    exchanges = []
+    for page in range(pages):
+        body = {'data': {'products': {
+                    'edges': [{'cursor': 'cursor-{}-{}'.format(page, i),
+                               'node': {'id': 'gid://shopify/Product/{}'.format(page * edges + i),
+                                        'handle': 'product-{}'.format(page * edges + i),
+                                        'updatedAt': '2020-01-01T00:00:00Z'}}
+                              for i in range(edges)],
+                    'pageInfo': {'hasNextPage': page < pages - 1}}},
+                'extensions': cost(edges + 2)}
+        exchanges.append({'method': 'POST', 'url': URL, 'data': None, 'status_code': 200,
+                          'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)})
+    return exchanges
+
+def mutation_exchange(products_per_batch):
+    body = {'data': {'p{}'.format(i): {'product': {'id': 'gid'}, 'userErrors': []}
+                     for i in range(products_per_batch)},
+            'extensions': cost(10 * products_per_batch)}
+    return {'method': 'POST', 'url': URL, 'data': None, 'status_code': 200,
+            'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)}
+
+def report(label, count, unit, elapsed):
+    print('{:<28} {:>10.1f} {}/s ({} {} in {:.2f}s)'.format(label, count / elapsed, unit, count, unit, elapsed))
+
+def bench_pagination(args):
+    if args.fixture:
+        transport = ReplayTransport(args.fixture, match_body=False, latency=args.latency)
+    else:
+        transport = ReplayTransport(exchanges=products_exchanges(args.pages, args.edges),
+                                    match_body=False, latency=args.latency)
+    shopify = GraphQL(url=URL, headers=HEADERS, payload='{}', session_pool=transport,
+                      bucket=CostBucket(1000, 50))
+    start = time.perf_counter()
+    count = sum(1 for _ in shopify.records())
+    report('pagination', count, 'records', time.perf_counter() - start)
+
+def bench_mutations(args):
+    transport = ReplayTransport(exchanges=[mutation_exchange(args.products_per_batch)],
+                                match_body=False, cycle=True, latency=args.latency)
+    metafields = ({'id': 'gid://shopify/Product/{}'.format(i // 10), 'namespace': 'bench',
+                   'key': 'key{}'.format(i % 10), 'value': 'value {}'.format(i)}
+                  for i in range(args.metafields))
+    pipeline = MetafieldBatchPipeline(metafields, products_per_batch=args.products_per_batch,
+                                      max_workers=args.workers, session_pool=transport, store=STORE)
+    start = time.perf_counter()
+    pipeline.run()
+    report('batched mutations', args.metafields, 'metafields', time.perf_counter() - start)
+
+def bench_csv(args):
+    try:
+        import pandas
+        from metafields import Metafields
+    except ImportError as e:
+        print('csv to metafields          skipped ({})'.format(e))
+        return
+    rows = args.metafields // 10
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'products.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Handle', 'Title', 'Image Src']
+                            + ['metafields.bench.key{}'.format(i) for i in range(10)])
+            for row in range(rows):
+                writer.writerow(['product-{}'.format(row), 'Title', 'https://cdn/image.jpg']
+                                + ['value {}'.format(i) for i in range(10)])
+        ids = {'product-{}'.format(row): 'gid://shopify/Product/{}'.format(row) for row in range(rows)}
+        start = time.perf_counter()
+        count = sum(1 for _ in Metafields(path, tag='').metafield_records(ids))
+        report('csv to metafields', count, 'metafields', time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixture', help='recorded exchanges of a paginated query')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--edges', type=int, default=250)
+    parser.add_argument('--metafields', type=int, default=20000)
+    parser.add_argument('--products-per-batch', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per request')
+    args = parser.parse_args()
+
+    bench_pagination(args)
+    bench_mutations(args)
+    bench_csv(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compare the per-page JSON work of the GraphQL accessors (``json_data``, ``has_next``,
+``cursor``, cost bookkeeping) on a plain ``requests.Response`` parsed by every accessor
+against a ``ParsedResponse`` which parses once (with orjson when it is installed).
+
+Usage:
+
+    python benchmarks/bench_response_parsing.py --pages 200 --edges 250
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example_pkg'))
+
+from requests.models import Response
+from response import ParsedResponse, orjson
+
+def products_page(edges):
+    """Build a response body shaped like a recorded ``products`` page
+    """
+    return json.dumps({
+        'data': {'products': {
+            'edges': [{'cursor': 'eyJsYXN0X2lkIjo{:012d}'.format(i),
+                       'node': {'id': 'gid://shopify/Product/{}'.format(4000000000000 + i),
+                                'handle': 'product-handle-{}'.format(i),
+                                'title': 'Product title number {}'.format(i),
+                                'tags': ['tag-a', 'tag-b', 'tag-c']}}
+                      for i in range(edges)],
+            'pageInfo': {'hasNextPage': True}}},
+        'extensions': {'cost': {'requestedQueryCost': 252, 'actualQueryCost': 252,
+                                'throttleStatus': {'maximumAvailable': 1000.0,
+                                                   'currentlyAvailable': 748,
+                                                   'restoreRate': 50.0}}}
+    }).encode('utf-8')
+
+def raw_response(body):
+    response = Response()
+    response.status_code = 200
+    response.encoding = 'utf-8'
+    response._content = body
+    return response
+
+def accessors(response, parse):
+    # the accessors of GraphQL before ParsedResponse: one parse each
+    data = parse(response)['data']['products']
+    data['edges']
+    parse(response)['data']['products']['pageInfo']['hasNextPage']
+    parse(response)['data']['products']['edges'][-1]['cursor']
+    parse(response)['extensions']['cost']['throttleStatus']
+
+def run(label, make_response, parse, body, pages):
+    start = time.perf_counter()
+    for _ in range(pages):
+        accessors(make_response(body), parse)
+    elapsed = time.perf_counter() - start
+    print('{:<36} {:>8.2f} ms/page'.format(label, elapsed / pages * 1000))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--edges', type=int, default=250)
+    args = parser.parse_args()
+
+    body = products_page(args.edges)
+    print('page size: {} KB, orjson: {}'.format(len(body) // 1024, orjson is not None))
+    run('json.loads(response.text) per access', raw_response, lambda r: json.loads(r.text),
+        body, args.pages)
+    run('ParsedResponse.json()', lambda b: ParsedResponse(raw_response(b)), lambda r: r.json(),
+        body, args.pages)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Compare requests/sec of one-shot ``requests.request`` calls against the pooled
+keep-alive sessions of ``connection.SessionPool``, using a local stub server.
+
+Usage:
+
+    python benchmarks/bench_session_pool.py --requests 500
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example_pkg'))
+
+import requests
+from connection import SessionPool
+
+BODY = b'{"data": {"products": {"edges": [], "pageInfo": {"hasNextPage": false}}}}'
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, without TCP_NODELAY Nagle's algorithm
+    # and delayed ACKs stall every response on a keep-alive connection
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+def run(label, request, url, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        request('POST', url, data='{}', headers={'content-type': 'application/json'})
+    elapsed = time.perf_counter() - start
+    print('{:<24} {:>8.1f} requests/sec ({} requests in {:.2f}s)'.format(label, n / elapsed, n, elapsed))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/admin/api/graphql.json'.format(server.server_address[1])
+
+    run('requests.request', requests.request, url, args.requests)
+    pool = SessionPool()
+    run('SessionPool.request', pool.request, url, args.requests)
+    pool.close()
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+from functools import partial
+from shopify import REQUEST, PAGE
+from graphql import GraphQL
+from rest import REST
+from records import CompactRecords
+
+class AsyncShopify:
+    """Asyncio counterpart of ``Shopify.session()`` and ``Shopify.data()``. Mixed into
+    ``GraphQL`` or ``REST`` it keeps the ``method/url/payload/headers/json_data/has_next``
+    contract of the request class, but awaits the cost bucket, the retry backoff, the
+    HTTP request (run on the pooled session in a worker thread) and the throttle delay
+    instead of blocking. One event loop can paginate many queries and stores at once.
+    ``records()``, ``stream_to()`` and ``data()`` are coroutines too; the thread based
+    ``prefetch_session()`` is not available.
+
+    Usage:
+
+    #async def main():
+    #    products, orders = await asyncio.gather(AsyncGraphQL(...).data(), AsyncGraphQL(...).data())
+    #asyncio.run(main())
+    """
+
+    async def api_request_async(self, *args, **kwargs):
+        """Asyncio counterpart of ``api_request()``: the cost bucket admission and the
+        retry backoff are awaited on the event loop, only the HTTP request itself runs
+        in the default executor. A waiting request doesn't occupy a worker thread.
+
+        Raises:
+            RetryError: When the request failed and can't be retried any more
+
+        Returns:
+            HTTP Response: Response of the request
+        """
+        loop = asyncio.get_running_loop()
+        cost = self._request_cost()
+        reserved = await self._bucket.acquire_async(cost) if cost is not None else None
+        response = None
+        try:
+            attempts, waited = 0, 0.0
+            while True:
+                attempts += 1
+                response, error = await loop.run_in_executor(None, partial(self._send, *args, **kwargs))
+                wait_seconds = self._retry_wait(attempts, waited, response, error, args[1])
+                if wait_seconds is None:
+                    return response
+                await asyncio.sleep(wait_seconds)
+                waited += wait_seconds
+        finally:
+            if reserved is not None:
+                self._settle(reserved, response)
+
+    async def delay_async(self, response):
+        """Await the delay computed by ``delay_seconds()`` without blocking the loop
+
+        Args:
+            response (HTTP Response): HTTP Response of API request
+        """
+        time_to_sleep = self.delay_seconds(response)
+        if time_to_sleep:
+            await asyncio.sleep(time_to_sleep)
+
+    async def session(self):
+        """Cursor based query of Shopify resource data, see ``Shopify.session()``.
+
+        Yields:
+            List of Dicts -- Async generator yielded data
+        """
+        steps = self.pagination()
+        step, result = next(steps), None
+        while True:
+            action, value = step
+            if action == REQUEST:
+                method, url, payload, headers = value
+                result = await self.api_request_async(method, url, data=payload, headers=headers)
+            elif action == PAGE:
+                yield value
+                result = None
+            else:
+                await self.delay_async(value)
+                result = None
+            try:
+                step = steps.send(result)
+            except StopIteration:
+                return
+
+    async def data(self, fields=None):
+        """Fetch all requested Shopify data, see ``Shopify.data()``.
+
+        Args:
+            fields (list, optional): Dotted paths of the fields to keep, the records are
+                collected in a ``CompactRecords`` then. Defaults to None.
+
+        Returns:
+            List of Dicts -- All requested data collected from a number of requests
+        """
+        data = CompactRecords(fields) if fields else []
+
+        async for record in self.records():
+            data.append(record)
+
+        self.log.debug("Shopify returned a total of {} records:".format(len(data)))
+
+        return data
+
+    async def records(self):
+        """Streaming counterpart of ``data()``, see ``Shopify.records()``.
+
+        Yields:
+            Dict -- A single record (query node or mutation result)
+        """
+        async for json_data in self.session():
+            for record in self.page_records(json_data):
+                yield record
+
+    async def stream_to(self, sink):
+        """Write all records to ``sink``, see ``Shopify.stream_to()``. The sink is
+        written from the event loop, it should be fast or buffered.
+
+        Args:
+            sink (Sink): Output sink, e.g. ``sinks.JSONLSink``
+
+        Returns:
+            int: Number of written records
+        """
+        count = 0
+        async for json_data in self.session():
+            records = self.page_records(json_data)
+            sink.write(records)
+            sink.flush()
+            count += len(records)
+        self.log.debug("Wrote a total of {} records to {}".format(count, sink))
+        return count
+
+    def prefetch_session(self, look_ahead=2):
+        # pages of concurrent requests are already fetched while others are processed
+        raise NotImplementedError('{} has no prefetch_session(), iterate `session()` with '
+                                  '`async for`'.format(type(self).__name__))
+
+    def pages(self, look_ahead=0):
+        raise NotImplementedError('{} has no pages(), iterate `session()` with `async for`'
+                                  .format(type(self).__name__))
+
+
+class AsyncGraphQL(AsyncShopify, GraphQL):
+    """``GraphQL`` request with async ``session()`` and ``data()``
+    """
+    pass
+
+
+class AsyncREST(AsyncShopify, REST):
+    """``REST`` request with async ``session()`` and ``data()``
+    """
+    pass
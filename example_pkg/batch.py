@@ -0,0 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import groupby, islice
+from threading import Lock
+from queries import UpdateProductsMetafields
+from graphql import GraphQL
+from retry import RetryError
+import logger
+
+# requested cost of one aliased ``productUpdate``: 10 for the mutation, 1 for ``product``
+PRODUCT_UPDATE_COST = 11
+
+class MetafieldBatchPipeline:
+    """Bulk metafield mutation pipeline. Groups the metafield records yielded by
+    ``Metafields.metafields()`` by product, aliases several products into one
+    ``productUpdate`` document and submits the batches through a bounded worker pool.
+    All workers are admitted by the shared cost bucket of the store (see
+    ``throttle.CostBucket``), so the pool stays within the throttle limits.
+
+    Usage:
+
+    #pipeline = MetafieldBatchPipeline(Metafields(csv_path, tag).metafields())
+    #results = pipeline.run()
+    """
+
+    def __init__(self, metafields, products_per_batch=10, max_workers=4,
+                 value_type='STRING', session_pool=None, store=None):
+        """Constructor
+
+        Args:
+            metafields (iterable): dicts with keys ``id``, ``namespace``, ``key``, ``value``
+            products_per_batch (int, optional): Products aliased into one request. Defaults to 10.
+            max_workers (int, optional): Concurrent requests. Defaults to 4.
+            value_type (str, optional): Metafield value type. Defaults to 'STRING'.
+            session_pool (SessionPool, optional): Pooled HTTP sessions. Defaults to the
+                shared pool of the process.
+            store (Store, optional): Store credentials. Defaults to the environment.
+        """
+        self.log = logger.configure("default")
+        self._metafields = metafields
+        self._products_per_batch = products_per_batch
+        self._max_workers = max_workers
+        self._value_type = value_type
+        self._session_pool = session_pool
+        self._store = store
+        # learned from ``requestedQueryCost``, seeded with an estimate so the first
+        # batches are admitted by the bucket at their real cost too
+        self._cost_per_product = PRODUCT_UPDATE_COST
+        self._cost_lock = Lock()
+
+    def products(self):
+        """Group consecutive metafield records of the same product
+
+        Yields:
+            tuple: ``(id, metafields)``
+        """
+        for id, metafields in groupby(self._metafields, key=lambda m: m['id']):
+            yield id, list(metafields)
+
+    def batches(self):
+        """Split the products into batches of ``products_per_batch``
+
+        Yields:
+            list: List of ``(id, metafields)`` tuples
+        """
+        products = self.products()
+        while True:
+            batch = list(islice(products, self._products_per_batch))
+            if not batch:
+                return
+            yield batch
+
+    def submit(self, number, batch):
+        """Submit a single batch mutation
+
+        Args:
+            number (int): Batch number, used for reporting
+            batch (list): List of ``(id, metafields)`` tuples
+
+        Returns:
+            dict: Batch result with keys ``batch``, ``ids``, ``userErrors``
+        """
+        query = UpdateProductsMetafields(batch, value_type=self._value_type, store=self._store)
+        shopify = GraphQL(url=query.url(), headers=query.headers(), payload=query.payload(),
+                          session_pool=self._session_pool, expected_cost=self.expected_cost(batch))
+        result = {'batch': number, 'ids': [id for id, _ in batch], 'userErrors': []}
+        try:
+            response = shopify.api_request(shopify.method(), shopify.url(),
+                                           data=shopify.payload(), headers=shopify.headers())
+        except RetryError as e:
+            result['userErrors'].append({'field': None, 'message': str(e)})
+            return result
+
+        body = response.json()
+        for error in body.get('errors', []):
+            result['userErrors'].append({'field': None, 'message': error.get('message')})
+        data = body.get('data') or {}
+        for alias, (id, _) in zip(query.aliases(), batch):
+            for error in (data.get(alias) or {}).get('userErrors', []):
+                result['userErrors'].append(dict(error, id=id))
+        if result['userErrors']:
+            self.log.error('Batch #{} has errors: {}'.format(number, result['userErrors']))
+        else:
+            self.log.info('Batch #{} updated {} products'.format(number, len(batch)))
+
+        if 'extensions' in body:
+            with self._cost_lock:
+                self._cost_per_product = body['extensions']['cost']['requestedQueryCost'] / len(batch)
+        return result
+
+    def expected_cost(self, batch):
+        """Return the expected query cost of a batch, by the cost per product of the last
+        response or ``PRODUCT_UPDATE_COST`` before the first response
+
+        Args:
+            batch (list): List of ``(id, metafields)`` tuples
+
+        Returns:
+            float: Query cost points
+        """
+        with self._cost_lock:
+            return self._cost_per_product * len(batch)
+
+    def run(self):
+        """Submit all batches, at most ``max_workers`` are in flight at a time
+
+        Returns:
+            list: Batch results, see ``submit()``
+        """
+        results = []
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            pending = set()
+            for number, batch in enumerate(self.batches(), start=1):
+                if len(pending) >= self._max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+                pending.add(executor.submit(self.submit, number, batch))
+            results.extend(future.result() for future in wait(pending).done)
+        results.sort(key=lambda result: result['batch'])
+        return results
+
+    def run_job(self, job):
+        """Submit all batches through a durable ``jobs.MutationJob``: the batches are
+        persisted before the first request, an interrupted import resumes without
+        repeating committed batches and failed batches are dead-lettered.
+
+        Args:
+            job (MutationJob): Job state
+
+        Returns:
+            dict: Number of batches by status, see ``MutationJob.status()``
+        """
+        if not job.enqueued():
+            job.enqueue(self.batches())
+        return job.run(lambda number, batch: self.submit(number, batch)['userErrors'])
@@ -0,0 +1,243 @@
+import re
+from json import loads
+from itertools import islice
+from time import sleep, monotonic
+from queries import RunBulkOperation, CurrentBulkOperation
+from graphql import GraphQL
+from retry import RetryError
+from connection import default_pool
+from records import CompactRecords
+import logger
+
+# a connection field: name, optional arguments and a selection of ``edges`` or ``nodes``
+_CONNECTION = re.compile(r'(\w+)\s*(?:\([^)]*\))?\s*\{\s*(edges|nodes)\b')
+
+class BulkOperationError(Exception):
+    """Raised when a bulk operation can't be started or doesn't complete
+
+    Attributes:
+        errors (list): Top-level ``errors`` of the GraphQL response, if any
+    """
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+class BulkOperation:
+    """Export mode based on Shopify's Bulk Operations API. Submits a query as a
+    ``bulkOperationRunQuery``, polls ``currentBulkOperation`` until the job is done and
+    streams the resulting JSONL file line by line. Records have the same
+    ``{'node': {...}}`` shape as ``GraphQL.data()`` (there are no cursors).
+
+    Shopify writes the nodes of a nested connection as lines of their own, with the id
+    of the parent in ``__parentId``, after their parent. They are put back into the
+    parent node, e.g. ``{'node': {'id': ..., 'variants': {'edges': [{'node': ...}]}}}``.
+    Queries with more than one nested connection are not supported.
+
+    Usage:
+
+    #query = GetProductsByTag(tag='summer')
+    #products = BulkOperation(url=query.url(), headers=query.headers(),
+    #                         query=query.bulk_query()).data()
+    """
+
+    FINISHED = ('COMPLETED', 'FAILED', 'CANCELED', 'EXPIRED')
+
+    def __init__(self, url, headers, query, poll_interval=5, timeout=None, session_pool=None,
+                 store=None):
+        """Constructor
+
+        Args:
+            url (str): Shopify GraphQL API URL
+            headers (dict): HTTP headers
+            query (str): GraphQL query without pagination arguments
+            poll_interval (int, optional): Seconds between status requests. Defaults to 5.
+            timeout (int, optional): Max. seconds to wait for completion. Defaults to None.
+            session_pool (SessionPool, optional): Pooled HTTP sessions. Defaults to the
+                shared pool of the process.
+            store (Store, optional): Store credentials. Defaults to the environment.
+
+        Raises:
+            ValueError: When the query has more than one nested connection
+        """
+        self.log = logger.configure("default")
+        connections = _CONNECTION.findall(query)
+        if len(connections) > 2:
+            raise ValueError('Bulk queries with more than one nested connection are not supported: {}'\
+                .format(', '.join(name for name, _ in connections[1:])))
+        # ``(name, selection)`` of the nested connection
+        self._nested = connections[1] if len(connections) == 2 else None
+        self._url = url
+        self._headers = headers
+        self._query = query
+        self._poll_interval = poll_interval
+        self._timeout = timeout
+        self._session_pool = session_pool
+        self._store = store
+
+    def _request(self, payload, name):
+        shopify = GraphQL(url=self._url, headers=self._headers, payload=payload,
+                          session_pool=self._session_pool)
+        try:
+            response = shopify.api_request(shopify.method(), shopify.url(),
+                                           data=shopify.payload(), headers=shopify.headers())
+            body = response.json()
+        except RetryError as e:
+            raise BulkOperationError('Request to {} failed'.format(self._url)) from e
+        except ValueError as e:
+            raise BulkOperationError('Response of {} is no JSON'.format(self._url)) from e
+        errors = body.get('errors')
+        if errors or not isinstance(body.get('data'), dict) or name not in body['data']:
+            self.log.error('Bulk operation request failed: {}'.format(errors))
+            raise BulkOperationError('Request of `{}` failed: {}'.format(name, errors), errors)
+        return body['data'][name]
+
+    def start(self):
+        """Submit the query as bulk operation
+
+        Raises:
+            BulkOperationError: When the response has ``errors`` or Shopify reports
+                ``userErrors``
+
+        Returns:
+            dict: ``bulkOperation`` with ``id`` and ``status``
+        """
+        result = self._request(RunBulkOperation(self._query, store=self._store).payload(),
+                               'bulkOperationRunQuery')
+        if result is None:
+            raise BulkOperationError('Bulk operation not started, no result')
+        if result['userErrors']:
+            self.log.error('Bulk operation not started: {}'.format(result['userErrors']))
+            raise BulkOperationError(result['userErrors'][0]['message'])
+        self.log.info('Started bulk operation {}'.format(result['bulkOperation']['id']))
+        return result['bulkOperation']
+
+    def status(self):
+        """Return the current bulk operation
+
+        Returns:
+            dict: ``currentBulkOperation`` with ``id``, ``status``, ``errorCode``,
+            ``objectCount`` and ``url``, None if no bulk operation was run
+        """
+        return self._request(CurrentBulkOperation(store=self._store).payload(),
+                             'currentBulkOperation')
+
+    def wait(self):
+        """Poll until the bulk operation is finished
+
+        Raises:
+            BulkOperationError: When there is no current operation, the operation fails
+                or ``timeout`` is exceeded
+
+        Returns:
+            dict: Completed bulk operation, see ``status()``
+        """
+        started = monotonic()
+        while True:
+            operation = self.status()
+            if operation is None:
+                raise BulkOperationError('No current bulk operation')
+            self.log.debug('Bulk operation {} is {}, {} objects'\
+                .format(operation['id'], operation['status'], operation['objectCount']))
+            if operation['status'] in self.FINISHED:
+                break
+            if self._timeout and monotonic() - started > self._timeout:
+                raise BulkOperationError('Bulk operation {} not finished after {} seconds'\
+                    .format(operation['id'], self._timeout))
+            sleep(self._poll_interval)
+
+        if operation['status'] != 'COMPLETED':
+            self.log.error('Bulk operation {} ended with status {}, error code {}'\
+                .format(operation['id'], operation['status'], operation['errorCode']))
+            raise BulkOperationError(operation['errorCode'] or operation['status'])
+        return operation
+
+    def records(self, url):
+        """Stream the JSONL result file line by line, the nodes of a nested connection
+        are added to their parent
+
+        Args:
+            url (str): Result URL of the completed bulk operation
+
+        Raises:
+            BulkOperationError: When a child node doesn't follow its parent
+
+        Yields:
+            dict: ``{'node': {...}}``
+        """
+        pool = self._session_pool or default_pool()
+        parent = None
+        with pool.request('GET', url, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                node = loads(line)
+                parent_id = node.pop('__parentId', None)
+                if parent_id is None:
+                    if parent is not None:
+                        yield {'node': parent}
+                    parent = node
+                    if self._nested:
+                        name, selection = self._nested
+                        parent[name] = {selection: []}
+                elif self._nested and parent is not None and parent.get('id') == parent_id:
+                    name, selection = self._nested
+                    parent[name][selection].append({'node': node} if selection == 'edges' else node)
+                else:
+                    raise BulkOperationError('Node {} of parent {} does not follow its parent'\
+                        .format(node.get('id'), parent_id))
+        if parent is not None:
+            yield {'node': parent}
+
+    def session(self):
+        """Run the bulk operation and stream its result
+
+        Yields:
+            dict: ``{'node': {...}}``
+        """
+        self.start()
+        operation = self.wait()
+        # an operation without results has no url
+        if operation['url']:
+            yield from self.records(operation['url'])
+
+    def data(self, fields=None):
+        """Run the bulk operation and return all records
+
+        Args:
+            fields (list, optional): Dotted paths of the fields to keep, see
+                ``Shopify.data()``. Defaults to None.
+
+        Returns:
+            List of Dicts -- All records of the bulk operation
+        """
+        if fields:
+            data = CompactRecords.from_records(self.session(), fields)
+        else:
+            data = list(self.session())
+        self.log.debug("Bulk operation returned a total of {} records".format(len(data)))
+        return data
+
+    def stream_to(self, sink, chunk_size=250):
+        """Run the bulk operation and write its records to ``sink``, the sink is flushed
+        after every ``chunk_size`` records
+
+        Args:
+            sink (Sink): Output sink, e.g. ``sinks.JSONLSink``
+            chunk_size (int, optional): Records per flush. Defaults to 250.
+
+        Returns:
+            int: Number of written records
+        """
+        count = 0
+        records = self.session()
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            sink.write(chunk)
+            sink.flush()
+            count += len(chunk)
+        self.log.debug("Wrote a total of {} records to {}".format(count, sink))
+        return count
@@ -0,0 +1,182 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+import logger
+
+class CheckpointStore:
+    """SQLite backed state of incremental syncs. Per store and query it keeps the
+    high-water mark (the start time of the last completed run), the cursor of the
+    last committed page of a running sync and a snapshot of all records by key.
+    Every page is committed together with its cursor, an interrupted run resumes after
+    the last committed page.
+    """
+
+    def __init__(self, path='data/state.sqlite'):
+        """Constructor
+
+        Args:
+            path (str, optional): SQLite database file. Defaults to 'data/state.sqlite'.
+        """
+        self.log = logger.configure("default")
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                             'store TEXT, query TEXT, high_water_mark TEXT, '
+                             'pending_high_water_mark TEXT, cursor TEXT, '
+                             'PRIMARY KEY (store, query))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS snapshot ('
+                             'store TEXT, query TEXT, key TEXT, record TEXT, '
+                             'PRIMARY KEY (store, query, key))')
+
+    def checkpoint(self, store, query):
+        """Return the checkpoint of a sync
+
+        Args:
+            store (str): Store identifier
+            query (str): Query identifier
+
+        Returns:
+            tuple: ``(high_water_mark, cursor)``, both None if there is no checkpoint
+        """
+        with self._lock:
+            row = self._db.execute('SELECT high_water_mark, cursor FROM checkpoints '
+                                   'WHERE store = ? AND query = ?', (store, query)).fetchone()
+        return row if row else (None, None)
+
+    def commit_page(self, store, query, records, cursor, high_water_mark=None):
+        """Merge the records of a page into the snapshot and save the page's cursor,
+        in one transaction. The high-water mark of the first committed page of a run is
+        kept until ``finish()``, also when an interrupted run is resumed.
+
+        Args:
+            store (str): Store identifier
+            query (str): Query identifier
+            records (list): ``(key, record)`` tuples
+            cursor (str): Cursor of the last record of the page
+            high_water_mark (str, optional): Start time of the run. Defaults to None.
+        """
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?)',
+                                 [(store, query, key, json.dumps(record)) for key, record in records])
+            self._db.execute('INSERT OR IGNORE INTO checkpoints (store, query) VALUES (?, ?)',
+                             (store, query))
+            self._db.execute('UPDATE checkpoints SET cursor = ?, pending_high_water_mark = '
+                             'COALESCE(pending_high_water_mark, ?) '
+                             'WHERE store = ? AND query = ?', (cursor, high_water_mark, store, query))
+
+    def finish(self, store, query):
+        """Mark a sync as completed: the high-water mark of the run becomes the
+        checkpoint, the cursor is reset
+
+        Args:
+            store (str): Store identifier
+            query (str): Query identifier
+        """
+        with self._lock, self._db:
+            self._db.execute('UPDATE checkpoints SET high_water_mark = MAX('
+                             'COALESCE(high_water_mark, \'\'), COALESCE(pending_high_water_mark, \'\')), '
+                             'pending_high_water_mark = NULL, cursor = NULL '
+                             'WHERE store = ? AND query = ?', (store, query))
+
+    def snapshot(self, store, query):
+        """Return the snapshot of a sync
+
+        Args:
+            store (str): Store identifier
+            query (str): Query identifier
+
+        Returns:
+            dict: Records by key
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT key, record FROM snapshot WHERE store = ? AND query = ?',
+                                    (store, query)).fetchall()
+        return {key: json.loads(record) for key, record in rows}
+
+    def reset(self, store, query):
+        """Delete checkpoint and snapshot of a sync, the next run is a full sync
+
+        Args:
+            store (str): Store identifier
+            query (str): Query identifier
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM checkpoints WHERE store = ? AND query = ?', (store, query))
+            self._db.execute('DELETE FROM snapshot WHERE store = ? AND query = ?', (store, query))
+
+    def close(self):
+        self._db.close()
+
+
+class IncrementalSync:
+    """Incremental sync of a paginated GraphQL list query. The first run fetches all
+    records, later runs only records with ``updatedAt`` at or after the high-water mark
+    of the last completed run, and merge them into the local snapshot. The high-water
+    mark is the start time of a run minus ``safety_margin``, so records updated while a
+    run pages through the results are fetched again by the next run. Deleted records
+    are not detected, call ``CheckpointStore.reset()`` for a full sync.
+
+    Usage:
+
+    #def request(search, cursor):
+    #    query = GetProductsByTag(tag='summer', search=search)
+    #    return GraphQL(url=query.url(), headers=query.headers(), payload=query.payload(),
+    #                   variables=query.variables(), cursor=cursor)
+    #products = IncrementalSync(CheckpointStore(), store, 'products:summer', request).run()
+    """
+
+    def __init__(self, state, store, query, request, key=lambda node: node['handle'],
+                 safety_margin=300):
+        """Constructor
+
+        Args:
+            state (CheckpointStore): Persisted sync state
+            store (str): Store identifier
+            query (str): Query identifier
+            request (callable): Returns a ``GraphQL`` request for ``(search, cursor)``,
+                ``search`` being the ``updated_at`` search term
+            key (callable, optional): Snapshot key of a node. Defaults to the handle.
+            safety_margin (int, optional): Seconds subtracted from the start time of a
+                run, covers clock skew to Shopify. Defaults to 300.
+        """
+        self.log = logger.configure("default")
+        self._state = state
+        self._store = store
+        self._query = query
+        self._request = request
+        self._key = key
+        self._safety_margin = safety_margin
+
+    def run(self):
+        """Fetch the changed records and merge them into the snapshot
+
+        Returns:
+            dict: Snapshot, nodes by key
+        """
+        started = (datetime.now(timezone.utc) - timedelta(seconds=self._safety_margin))\
+            .strftime('%Y-%m-%dT%H:%M:%SZ')
+        high_water_mark, cursor = self._state.checkpoint(self._store, self._query)
+        search = "updated_at:>='{}'".format(high_water_mark) if high_water_mark else ''
+        self.log.info('Sync of {} {}, updated since {}, resuming after cursor {}'\
+            .format(self._store, self._query, high_water_mark, cursor))
+
+        shopify = self._request(search, cursor)
+        count = 0
+        for json_data in shopify.session():
+            records = shopify.page_records(json_data)
+            if not records:
+                continue
+            self._state.commit_page(
+                self._store, self._query,
+                [(self._key(record['node']), record['node']) for record in records],
+                records[-1]['cursor'], started)
+            count += len(records)
+        self._state.finish(self._store, self._query)
+        self.log.info('Sync of {} {} merged {} changed records'.format(self._store, self._query, count))
+        return self._state.snapshot(self._store, self._query)
@@ -0,0 +1,103 @@
+from threading import Lock
+import logger
+
+class SessionPool:
+    """Shared, connection-pooled HTTP sessions for Shopify API requests. One
+    ``requests.Session`` is kept per host, so all pages of a pagination (and all
+    clients talking to the same store) reuse keep-alive TLS connections instead of
+    opening a new one for every request. The connection pool of a host holds
+    ``pool_maxsize`` connections, or the size set for the host in ``host_pool_maxsize``,
+    e.g. more for a store paginated by many shards.
+
+    Usage:
+
+    #pool = SessionPool(pool_maxsize=20, host_pool_maxsize={'big-store.myshopify.com': 50})
+    #shopify = GraphQL(url=url, headers=headers, payload=payload, session_pool=pool)
+    """
+
+    def __init__(self, pool_maxsize=10, host_pool_maxsize=None, compression=True,
+                 keep_alive=True):
+        """Constructor
+
+        Args:
+            pool_maxsize (int, optional): Max. connections kept open per host. Defaults to 10.
+            host_pool_maxsize (dict, optional): Max. connections by host, overrides
+                ``pool_maxsize``. Defaults to None.
+            compression (bool, optional): Ask Shopify for gzip/deflate encoded responses.
+                Defaults to True.
+            keep_alive (bool, optional): Keep connections open between requests.
+                Defaults to True.
+        """
+        self.log = logger.configure("default")
+        self._pool_maxsize = pool_maxsize
+        self._host_pool_maxsize = dict(host_pool_maxsize or {})
+        self._compression = compression
+        self._keep_alive = keep_alive
+        self._sessions = {}
+        self._lock = Lock()
+
+    def session(self, url):
+        """Return the pooled session for the host of ``url``, create it on first use
+
+        Args:
+            url (str): Request URL
+
+        Returns:
+            requests.Session: Session bound to a sized connection pool
+        """
+        host = url.split('/')[2] if '://' in url else url
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._new_session(host)
+                self._sessions[host] = session
+                self.log.debug('Opened pooled HTTP session for {}'.format(host))
+            return session
+
+    def _new_session(self, host):
+        # requests is imported with the first session, not with the package
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+        session = Session()
+        # a session only talks to its host, its adapter needs a single connection pool
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self._host_pool_maxsize.get(host, self._pool_maxsize))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = 'gzip, deflate' if self._compression else 'identity'
+        session.headers['Connection'] = 'keep-alive' if self._keep_alive else 'close'
+        return session
+
+    def request(self, method, url, **kwargs):
+        """Submit a HTTP request through the pooled session of the URL's host. Same
+        signature as ``requests.request``.
+
+        Returns:
+            requests.Response: HTTP response
+        """
+        return self.session(url).request(method, url, **kwargs)
+
+    def close(self):
+        """Close all pooled sessions and their connections
+        """
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+_default_pool = None
+_default_pool_lock = Lock()
+
+def default_pool():
+    """Return the process wide session pool which is shared by all ``Shopify`` clients
+    unless a dedicated pool is passed in.
+
+    Returns:
+        SessionPool: shared session pool
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SessionPool()
+        return _default_pool
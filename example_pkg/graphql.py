@@ -1,10 +1,21 @@
 from shopify import Shopify
-from math import ceil
-from json import loads
-from util import config
 from time import sleep
+from throttle import shared_bucket
+from settings import settings
+from templates import QueryTemplate
 import logger
 
+class GraphQLError(Exception):
+    """Raised when a GraphQL response has top-level ``errors`` or no ``data``
+
+    Attributes:
+        errors (list): ``errors`` of the response body
+    """
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
 class GraphQL(Shopify):
     """Class for submitting GraphQL requests to Shopify. Handles any kind of
     GraphQL API request to the store including cursor based pagination and throtteling.
@@ -14,24 +25,50 @@ class GraphQL(Shopify):
     """
 
     def __init__(self, url, headers, payload, query_filter=None,
-                 max_cost_points=1000, leak_rate=50, max_retries=5 ):
+                 max_cost_points=None, leak_rate=None, max_retries=None, session_pool=None,
+                 bucket=None, expected_cost=0, cursor=None, variables=None, retry_policy=None,
+                 instrumentation=None):
         """Constructor for GraphQL/Shopify request
 
         Args:
             url (String): Shopify GraphQL API URL
             headers (dict): HTTP headers
-            payload (str): Query/Mutation string
+            payload (str or QueryTemplate): Query/Mutation string, or a query template
+                whose pagination cursor is passed as variable ``after``
             query_filter (str, optional): [description]. Defaults to None.
-            max_cost_points (int, optional): [description]. Defaults to 1000.
-            leak_rate (int, optional): [description]. Defaults to 50.
-            max_retries (int, optional): [description]. Defaults to 5.
+            max_cost_points (int, optional): Size of the cost bucket until the first
+                response reports it. Defaults to ``max_cost_points`` of config.yml.
+            leak_rate (int, optional): Restore rate of the cost bucket until the first
+                response reports it. Defaults to ``leak_rate`` of config.yml.
+            max_retries (int, optional): [description]. Defaults to ``max_retries`` of
+                config.yml.
+            session_pool (SessionPool, optional): Pooled HTTP sessions. Defaults to the
+                shared pool of the process.
+            bucket (CostBucket, optional): Query cost scheduler. Defaults to the bucket
+                shared by all requests to ``url`` in this process.
+            expected_cost (int, optional): Cost of the first request, later requests
+                use ``requestedQueryCost`` of the previous response. Defaults to 0.
+            cursor (str, optional): Cursor to resume the pagination after, e.g. from a
+                checkpoint. Defaults to None.
+            variables (dict, optional): Variables of a query template. Defaults to None.
+            retry_policy (RetryPolicy, optional): Retry/backoff policy. Defaults to a
+                policy with ``max_retries``.
+            instrumentation (Instrumentation, optional): Metrics and hooks. Defaults to
+                the shared instrumentation of the process.
         """
-        super().__init__(max_retries=max_retries)
+        super().__init__(max_retries=max_retries, session_pool=session_pool,
+                         retry_policy=retry_policy, instrumentation=instrumentation)
         self.log = logger.configure("default")
         self._url = url
         self._headers = headers
         self._payload = payload
         self._query_filter = query_filter
+        self._bucket = bucket or shared_bucket(url, max_cost_points or settings().max_cost_points(),
+                                               leak_rate or settings().leak_rate())
+        # cost of the next request, taken from ``requestedQueryCost`` of the last response
+        self._expected_cost = expected_cost
+        self._start_cursor = cursor
+        self._variables = variables or {}
         
     def method(self):
         return 'POST'
@@ -40,7 +77,9 @@ class GraphQL(Shopify):
         return self._url
 
     def payload(self, response=None):
-        """Return payload string. If query requires a filter, it is set in 
+        """Return payload string. If the payload is a ``QueryTemplate``, the payload is
+        built from ``self._variables`` and the cursor of the response.
+        If query requires a filter, it is set in 
         ``self._query_filter``and will be inserted into the payload string.
         Otherwise ``self._payload weill be returned.
 
@@ -51,17 +90,25 @@ class GraphQL(Shopify):
             str: The payload string which will be used in the HTTP request
         """
 
+        # query template, the cursor is passed as variable
+        if isinstance(self._payload, QueryTemplate):
+            cursor = self.cursor(response) if response else self._start_cursor
+            if cursor:
+                return self._payload.payload(after=cursor, **self._variables)
+            return self._payload.payload(**self._variables)
         # there is a query filter, insert into payload string
-        if self._query_filter:
+        elif self._query_filter:
             try:
                 assert '{}' in self._payload, 'Payload should include `{}` to insert query filter'
             except AssertionError:
                 self.log.error('Payload must include `{}` to allow insertion of query filter')
             query = '(' + self._query_filter +'{})'
-            if not response: 
+            cursor = self.cursor(response) if response else self._start_cursor
+            if not cursor: 
                 query = query.format('')
             else:
-                query = query.format(', after: "' + self.cursor(response) + '"')  
+                # the payload is a JSON document, quotes of the GraphQL string are escaped
+                query = query.format(', after: \\"' + cursor + '\\"')  
             self.log.debug('query filter: {}'.format(query))
             self.log.debug('payload: {}'.format(self._payload))
             return self._payload.format(query)
@@ -99,7 +146,7 @@ class GraphQL(Shopify):
             String: Name of Shopify API object
         """
         try:   
-            data = loads(response.text)['data'] 
+            data = response.json()['data']
             first_key_of_dict = next(iter(data))
             return data[first_key_of_dict]
         except:
@@ -123,33 +170,47 @@ class GraphQL(Shopify):
             self.log.debug("There is no cursor. Check if it's included in the query, \
                 if not put a line with cursor after node.")
 
+    def _request_cost(self):
+        # the requested cost of the last response, admitted before the request is sent
+        return self._expected_cost
+
+    def _settle(self, reserved, response):
+        """Synchronize the cost bucket with the throttle status of the response
+        """
+        throttle_status = None
+        try:
+            cost = response.json()['extensions']['cost']
+            throttle_status = cost['throttleStatus']
+            self._expected_cost = cost['requestedQueryCost']
+            self._instrumentation.count('query_cost', cost.get('actualQueryCost') or 0)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            self.log.debug('No query cost in response, cost bucket not synchronized')
+        finally:
+            self._bucket.settle(reserved, throttle_status)
+
     def delay(self, response):
-        """Based on the throtteling information of the response, execute a delay before
+        """Based on the throtteling information of the cost bucket, execute a delay before
         fetching additional data.
 
         Args:
             response (HTTP Response): Result of a GraphQL request to Shopify
         """
-        max_cost_points = int(config()["general"]["max_cost_points"])
-        leak_rate = int(config()["general"]["leak_rate"])
-
-        try:
-            cost = loads(response.text)['extensions']['cost']
-            remaining_cost = cost['throttleStatus']['currentlyAvailable']
-            actual_query_cost  = cost['actualQueryCost'] 
-        except KeyError as e:
-            self.log.error('Can`t extract query cost from JSON response:\n{}, error: {}'\
-                .format(response.text, e))
-
-        if remaining_cost < actual_query_cost:
-            time_to_sleep = ceil((max_cost_points - remaining_cost)/leak_rate)
-            self.log.info('Delaying next API request for {} seconds to avoid blocking'\
-                .format(time_to_sleep))
+        time_to_sleep = self.delay_seconds(response)
+        if time_to_sleep:
             sleep(time_to_sleep)
 
-    
+    def delay_seconds(self, response):
+        """Compute the time until the cost bucket admits the next request, with
+        sub-second precision.
 
-    
+        Args:
+            response (HTTP Response): Result of a GraphQL request to Shopify
 
-    
-    
\ No newline at end of file
+        Returns:
+            float: Seconds to wait before the next request, 0.0 if there is enough budget
+        """
+        time_to_sleep = self._bucket.wait_time(self._expected_cost)
+        if time_to_sleep:
+            self.log.info('Delaying next API request for {:.2f} seconds to avoid blocking'\
+                .format(time_to_sleep))
+        return time_to_sleep
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+from threading import Lock
+from time import time
+import logger
+from records import IdIndex
+
+class IdCache:
+    """Persistent lookup cache of Shopify GIDs, e.g. product handle -> product GID or
+    SKU -> variant GID, backed by SQLite. Every mapping (store and kind) is refreshed as
+    a whole and expires ``ttl`` seconds after its last refresh.
+
+    Usage:
+
+    #cache = IdCache(ttl=24 * 3600)
+    #ids = cache.get_or_refresh(store, 'product', Metafields(csv_path, tag).product_handle_to_id)
+    #metafields = Metafields(csv_path, tag, id_cache=cache).metafields()
+    """
+
+    def __init__(self, path='data/id_cache.sqlite', ttl=86400):
+        """Constructor
+
+        Args:
+            path (str, optional): SQLite database file. Defaults to 'data/id_cache.sqlite'.
+            ttl (int, optional): Seconds until a mapping expires. Defaults to 86400.
+        """
+        self.log = logger.configure("default")
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._ttl = ttl
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS ids ('
+                             'store TEXT, kind TEXT, key TEXT, gid TEXT, '
+                             'PRIMARY KEY (store, kind, key))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS refreshed ('
+                             'store TEXT, kind TEXT, refreshed REAL, '
+                             'PRIMARY KEY (store, kind))')
+
+    def is_fresh(self, store, kind='product'):
+        """Return True if the mapping was refreshed less than ``ttl`` seconds ago
+
+        Args:
+            store (str): Store identifier
+            kind (str, optional): Kind of mapping, e.g. 'product' or 'variant'. Defaults to 'product'.
+
+        Returns:
+            bool: True if the mapping is fresh
+        """
+        with self._lock:
+            row = self._db.execute('SELECT refreshed FROM refreshed WHERE store = ? AND kind = ?',
+                                   (store, kind)).fetchone()
+        return bool(row) and time() - row[0] < self._ttl
+
+    def get(self, store, key, kind='product'):
+        """Return the GID of a single key
+
+        Args:
+            store (str): Store identifier
+            key (str): Handle, SKU, ...
+            kind (str, optional): Kind of mapping. Defaults to 'product'.
+
+        Returns:
+            str: GID, None if unknown or the mapping expired
+        """
+        if not self.is_fresh(store, kind):
+            return None
+        with self._lock:
+            row = self._db.execute('SELECT gid FROM ids WHERE store = ? AND kind = ? AND key = ?',
+                                   (store, kind, key)).fetchone()
+        return row[0] if row else None
+
+    def get_all(self, store, kind='product'):
+        """Return the complete mapping
+
+        Args:
+            store (str): Store identifier
+            kind (str, optional): Kind of mapping. Defaults to 'product'.
+
+        Returns:
+            IdIndex: GIDs by key, None if the mapping expired
+        """
+        if not self.is_fresh(store, kind):
+            return None
+        with self._lock:
+            rows = self._db.execute('SELECT key, gid FROM ids WHERE store = ? AND kind = ?',
+                                    (store, kind)).fetchall()
+        return IdIndex(rows)
+
+    def refresh(self, store, mapping, kind='product'):
+        """Replace the complete mapping in one transaction
+
+        Args:
+            store (str): Store identifier
+            mapping (Mapping): GIDs by key
+            kind (str, optional): Kind of mapping. Defaults to 'product'.
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM ids WHERE store = ? AND kind = ?', (store, kind))
+            self._db.executemany('INSERT INTO ids VALUES (?, ?, ?, ?)',
+                                 [(store, kind, key, gid) for key, gid in mapping.items()])
+            self._db.execute('INSERT OR REPLACE INTO refreshed VALUES (?, ?, ?)',
+                             (store, kind, time()))
+        self.log.debug('Cached {} {} ids of {}'.format(len(mapping), kind, store))
+
+    def get_or_refresh(self, store, kind, loader):
+        """Return the mapping from the cache, if it expired load and cache it
+
+        Args:
+            store (str): Store identifier
+            kind (str): Kind of mapping
+            loader (callable): Returns the complete mapping, e.g.
+                ``Metafields.product_handle_to_id``
+
+        Returns:
+            dict: GIDs by key
+        """
+        mapping = self.get_all(store, kind)
+        if mapping is None:
+            self.log.info('{} id cache of {} expired, refreshing'.format(kind, store))
+            mapping = loader()
+            self.refresh(store, mapping, kind)
+        return mapping
+
+    def invalidate(self, store, kind=None, keys=None):
+        """Remove cached ids. Without ``keys`` the whole mapping expires.
+
+        Args:
+            store (str): Store identifier
+            kind (str, optional): Kind of mapping, all kinds if None. Defaults to None.
+            keys (list, optional): Keys to remove. Defaults to None.
+        """
+        with self._lock, self._db:
+            if keys is not None:
+                self._db.executemany('DELETE FROM ids WHERE store = ? AND kind = ? AND key = ?',
+                                     [(store, kind or 'product', key) for key in keys])
+            elif kind is not None:
+                self._db.execute('DELETE FROM ids WHERE store = ? AND kind = ?', (store, kind))
+                self._db.execute('DELETE FROM refreshed WHERE store = ? AND kind = ?', (store, kind))
+            else:
+                self._db.execute('DELETE FROM ids WHERE store = ?', (store,))
+                self._db.execute('DELETE FROM refreshed WHERE store = ?', (store,))
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,220 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from threading import Lock
+from time import time
+from retry import RetryError
+import logger
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+class MutationJob:
+    """Durable, resumable mutation job backed by SQLite. The queue of mutation items and
+    the status of every item are persisted; progress is committed every
+    ``commit_every`` items, so a crashed or interrupted job resumes with the items not
+    committed as done. Items are applied at least once: items completed after the last
+    commit are submitted again after a crash. Items with ``userErrors`` or exhausted
+    retries go to a dead-letter table and can be re-driven with ``redrive()``.
+
+    Usage:
+
+    #job = MutationJob('data/jobs.sqlite', 'metafields-2021-01-15')
+    #pipeline = MetafieldBatchPipeline(Metafields(csv_path, tag).metafields())
+    #pipeline.run_job(job)
+    #job.dead_letters()
+    #job.redrive()
+    #pipeline.run_job(job)
+    """
+
+    def __init__(self, path='data/jobs.sqlite', job='default', commit_every=100, max_workers=1):
+        """Constructor
+
+        Args:
+            path (str, optional): SQLite database file. Defaults to 'data/jobs.sqlite'.
+            job (str, optional): Job identifier, several jobs can share a file.
+                Defaults to 'default'.
+            commit_every (int, optional): Items per committed transaction. Defaults to 100.
+            max_workers (int, optional): Items submitted concurrently. Defaults to 1.
+        """
+        self.log = logger.configure("default")
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._job = job
+        self._commit_every = commit_every
+        self._max_workers = max_workers
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                             'job TEXT PRIMARY KEY, enqueued REAL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS items ('
+                             'job TEXT, item INTEGER, payload TEXT, status TEXT, '
+                             'attempts INTEGER DEFAULT 0, updated REAL, '
+                             'PRIMARY KEY (job, item))')
+            self._db.execute('CREATE TABLE IF NOT EXISTS dead_letters ('
+                             'job TEXT, item INTEGER, errors TEXT, failed REAL, '
+                             'PRIMARY KEY (job, item))')
+
+    def enqueued(self):
+        """Return True if the queue of the job was persisted completely
+
+        Returns:
+            bool: True if ``enqueue()`` completed
+        """
+        with self._lock:
+            row = self._db.execute('SELECT enqueued FROM jobs WHERE job = ?', (self._job,)).fetchone()
+        return bool(row and row[0])
+
+    def enqueue(self, items):
+        """Persist the mutation items, numbered in the order of ``items``. Items which
+        are already queued keep their status, so an interrupted ``enqueue()`` can simply
+        be repeated with the same items.
+
+        Args:
+            items (iterable): JSON serializable items, e.g. metafield batches
+
+        Returns:
+            int: Number of items
+        """
+        items = iter(items)
+        count = 0
+        while True:
+            chunk = list(islice(items, self._commit_every))
+            if not chunk:
+                break
+            with self._lock, self._db:
+                self._db.executemany('INSERT OR IGNORE INTO items (job, item, payload, status) '
+                                     'VALUES (?, ?, ?, ?)',
+                                     [(self._job, count + number, json.dumps(item), PENDING)
+                                      for number, item in enumerate(chunk, start=1)])
+            count += len(chunk)
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?)', (self._job, time()))
+        self.log.info('Job {} enqueued {} items'.format(self._job, count))
+        return count
+
+    def pending(self):
+        """Yield the items not done yet and not dead-lettered
+
+        Yields:
+            tuple: ``(item, payload)``
+        """
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute('SELECT item, payload FROM items WHERE job = ? AND status = ? '
+                                        'AND item > ? ORDER BY item LIMIT ?',
+                                        (self._job, PENDING, last, self._commit_every)).fetchall()
+            if not rows:
+                return
+            for item, payload in rows:
+                yield item, json.loads(payload)
+            last = rows[-1][0]
+
+    def _commit(self, outcomes):
+        now = time()
+        with self._lock, self._db:
+            self._db.executemany('UPDATE items SET status = ?, attempts = attempts + 1, updated = ? '
+                                 'WHERE job = ? AND item = ?',
+                                 [(FAILED if errors else DONE, now, self._job, item)
+                                  for item, errors in outcomes])
+            self._db.executemany('INSERT OR REPLACE INTO dead_letters VALUES (?, ?, ?, ?)',
+                                 [(self._job, item, json.dumps(errors), now)
+                                  for item, errors in outcomes if errors])
+
+    def _apply(self, handler, item, payload):
+        try:
+            return item, handler(item, payload)
+        except RetryError as e:
+            return item, [{'field': None, 'message': str(e), 'kind': e.kind}]
+
+    def run(self, handler):
+        """Submit all pending items. ``handler(item, payload)`` applies a single item and
+        returns its errors, an empty list on success. Items with errors or a
+        ``RetryError`` are dead-lettered, any other exception stops the job after
+        committing the finished items.
+
+        Args:
+            handler (callable): Applies an item, returns a list of ``userErrors``
+
+        Returns:
+            dict: Number of items by status, see ``status()``
+        """
+        outcomes = []
+        try:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                pending = set()
+                for item, payload in self.pending():
+                    if len(pending) >= self._max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        outcomes.extend(future.result() for future in done)
+                    if len(outcomes) >= self._commit_every:
+                        self._commit(outcomes)
+                        outcomes = []
+                    pending.add(executor.submit(self._apply, handler, item, payload))
+                for future in wait(pending).done:
+                    outcomes.append(future.result())
+        finally:
+            # keep the finished items even if the job is interrupted
+            self._commit(outcomes)
+        status = self.status()
+        self.log.info('Job {} finished: {}'.format(self._job, status))
+        return status
+
+    def status(self):
+        """Return the number of items by status
+
+        Returns:
+            dict: Counts of ``pending``, ``done`` and ``failed`` items
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT status, COUNT(*) FROM items WHERE job = ? GROUP BY status',
+                                    (self._job,)).fetchall()
+        return dict({PENDING: 0, DONE: 0, FAILED: 0}, **dict(rows))
+
+    def dead_letters(self):
+        """Return the dead-lettered items
+
+        Returns:
+            list: Tuples ``(item, payload, errors)``
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT d.item, i.payload, d.errors FROM dead_letters d '
+                                    'JOIN items i ON i.job = d.job AND i.item = d.item '
+                                    'WHERE d.job = ? ORDER BY d.item', (self._job,)).fetchall()
+        return [(item, json.loads(payload), json.loads(errors)) for item, payload, errors in rows]
+
+    def redrive(self, items=None):
+        """Move dead-lettered items back into the queue, the next ``run()`` submits them
+        again
+
+        Args:
+            items (list, optional): Items to re-drive. Defaults to all dead letters.
+
+        Returns:
+            int: Number of re-driven items
+        """
+        if items is None:
+            items = [item for item, _, _ in self.dead_letters()]
+        with self._lock, self._db:
+            self._db.executemany('UPDATE items SET status = ? WHERE job = ? AND item = ? AND status = ?',
+                                 [(PENDING, self._job, item, FAILED) for item in items])
+            self._db.executemany('DELETE FROM dead_letters WHERE job = ? AND item = ?',
+                                 [(self._job, item) for item in items])
+        self.log.info('Job {} re-drives {} items'.format(self._job, len(items)))
+        return len(items)
+
+    def reset(self):
+        """Delete queue, status and dead letters of the job
+        """
+        with self._lock, self._db:
+            for table in ('jobs', 'items', 'dead_letters'):
+                self._db.execute('DELETE FROM {} WHERE job = ?'.format(table), (self._job,))
+
+    def close(self):
+        self._db.close()
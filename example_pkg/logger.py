@@ -1,22 +1,46 @@
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import os
+import queue
 from datetime import datetime
+from threading import Lock
 from util import log_filename
 
-def configure(name):
-    """Configure Logging
-    
+_lock = Lock()
+_configured = False
+_listener = None
+
+def configure(name, non_blocking=False):
+    """Configure Logging. The configuration is applied only once per process, later
+    calls just return the logger.
+
+    The level of the ``default`` logger is taken from the environment variable
+    ``SHOPIFY_LOG_LEVEL``, defaults to ``DEBUG``.
+
     Arguments:
-        name {[type]} -- [description]
-    
+        name {str} -- Name of the logger
+        non_blocking {bool} -- Hand log records to a queue and write them to console
+            and file in a background thread (default: {False})
+
     Returns:
         logging.Logger -- Customized logger
     """
+    global _configured
+    with _lock:
+        if not _configured:
+            _dict_config()
+            _configured = True
+        if non_blocking and _listener is None:
+            _start_listener()
+    return logging.getLogger(name)
 
+def _dict_config():
     logging.config.dictConfig({
         'version': 1,
         'formatters': {
-            'default': {'format': '%(asctime)s - %(levelname)s - %(message)s', 
+            'default': {'format': '%(asctime)s - %(levelname)s - %(message)s',
                         'datefmt': '%Y-%m-%d %H:%M:%S'}
         },
         'handlers': {
@@ -35,10 +59,23 @@ def configure(name):
         },
         'loggers': {
             'default': {
-                'level': 'DEBUG',
+                'level': os.environ.get('SHOPIFY_LOG_LEVEL', 'DEBUG'),
                 'handlers': ['console', 'file']
             }
         },
         'disable_existing_loggers': False
     })
-    return logging.getLogger(name)
+
+def _start_listener():
+    """Move the handlers of the ``default`` logger behind a queue, a background thread
+    writes the records
+    """
+    global _listener
+    log = logging.getLogger('default')
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, *log.handlers, respect_handler_level=True)
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.addHandler(logging.handlers.QueueHandler(records))
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,24 +1,51 @@
 import logger
 import os
-import numpy as np
-import pandas as pd
-from queries import GetProductsByTag
-from graphql import GraphQL
+from itertools import groupby, islice
+from queries import GetProductsByTag, GetProductsMetafields
+from graphql import GraphQL, GraphQLError
+from bulk_operation import BulkOperation
+from checkpoint import IncrementalSync
+from records import IdIndex
 
 class Metafields:
     """
     Class handling metafields creation based on CSV data
 
     """
-    def __init__(self, csv_path, tag):
+    def __init__(self, csv_path, tag, bulk=False, state=None, id_cache=None, store=None):
         """Constructor
 
         Args:
             csv_path (str): [description]
             tag (str): Tag to filter products
+            bulk (bool, optional): Fetch products with a bulk operation instead of
+                cursor based pagination. Defaults to False.
+            state (CheckpointStore, optional): Sync products incrementally, only changes
+                since the last run are fetched. Defaults to None.
+            id_cache (IdCache, optional): Cache of the handle/id map, it is only
+                fetched when the cache expired. Defaults to None.
+            store (Store, optional): Store credentials. Defaults to the store set in the
+                environment.
         """
         self.__csv_path = csv_path
         self.__tag = tag
+        self.__bulk = bulk
+        self.__state = state
+        self.__id_cache = id_cache
+        self.__store = store
+
+    def ids(self) -> dict:
+        """Return the handle/id map from the id cache if there is one and it's fresh,
+        otherwise fetch it with ``product_handle_to_id()``.
+
+        Returns:
+            Mapping: a mapping with key: handle, value: id
+        """
+        if self.__id_cache is None:
+            return self.product_handle_to_id()
+        store = GetProductsByTag(store=self.__store).url()
+        kind = 'product:{}'.format(self.__tag or '')
+        return self.__id_cache.get_or_refresh(store, kind, self.product_handle_to_id)
 
     def product_handle_to_id(self) -> dict:
         """Return dict with all products, filtered by a tag.
@@ -27,20 +54,46 @@ class Metafields:
             tag (str): Tag used to filter relevant products
 
         Returns:
-            dict: a dictionary with key: handle, value: id
+            IdIndex: a compact mapping with key: handle, value: id
         """
-        query_params = {}
+        query_params = {'store': self.__store}
         # if tag is specified, filter products by tag
         if self.__tag:
             query_params['tag'] = self.__tag 
 
+        if self.__state:
+            return self.incremental_product_handle_to_id(query_params)
+
         # Get list of all products
         query = GetProductsByTag(**query_params)
-        shopify = GraphQL  (url=query.url(), headers=query.headers(), 
-                            payload=query.payload(), query_filter=query.query_filter())
-        products = shopify.data()
-        # Make a dict to retrieve the product id by product handle
-        return { product['node']['handle']:product['node']['id'] for product in products }
+        if self.__bulk:
+            shopify = BulkOperation(url=query.url(), headers=query.headers(),
+                                    query=query.bulk_query(), store=self.__store)
+        else:
+            shopify = GraphQL  (url=query.url(), headers=query.headers(), 
+                                payload=query.payload(), variables=query.variables())
+        products = shopify.data(fields=['node.handle', 'node.id'])
+        # Make an index to retrieve the product id by product handle
+        return IdIndex.from_records(products, 'node.handle', 'node.id')
+
+    def incremental_product_handle_to_id(self, query_params) -> dict:
+        """Return dict with all products from the local snapshot, after fetching the
+        products changed since the last run.
+
+        Args:
+            query_params (dict): Parameters of ``GetProductsByTag``
+
+        Returns:
+            IdIndex: a compact mapping with key: handle, value: id
+        """
+        def request(search, cursor):
+            query = GetProductsByTag(search=search, **query_params)
+            return GraphQL(url=query.url(), headers=query.headers(), payload=query.payload(),
+                           variables=query.variables(), cursor=cursor)
+
+        store = GetProductsByTag(**query_params).url()
+        sync = IncrementalSync(self.__state, store, 'products:{}'.format(self.__tag or ''), request)
+        return IdIndex((handle, node['id']) for handle, node in sync.run().items())
 
     def csv_to_dict(self):
         """Return handle and product metafield values from a Shopify product import file, 
@@ -56,6 +109,7 @@ class Metafields:
         Returns:
             dict: with key: handle, value: dict with metafield information
         """
+        import pandas as pd
         log = logger.configure("default")
         try: 
             df = pd.read_csv(self.__csv_path)
@@ -76,13 +130,146 @@ class Metafields:
                 df = df[~df.index.duplicated(keep='first')]
                 return df.to_dict('index')
 
+    def metafield_columns(self) -> dict:
+        """Return namespace and key of each ``metafields.<namespace>.<key>`` column, read
+        from the header of the CSV file only.
+
+        Raises:
+            ValueError: when necessary columns `Handle` and `metafields...` don't exist.
+
+        Returns:
+            dict: with key: column name, value: tuple (namespace, key)
+        """
+        import pandas as pd
+        log = logger.configure("default")
+        try:
+            cols = list(pd.read_csv(self.__csv_path, nrows=0).columns)
+        except IOError as e:
+            log.error('Could not import {}. Got error {}'.format(self.__csv_path, e))
+            raise
+        metafield_cols = [col for col in cols if 'metafields' in col]
+        if metafield_cols == [] or 'Handle' not in cols:
+            log.error('{} does not contain `Handle` or `metafields` named columns'.format(self.__csv_path))
+            raise ValueError('{} does not contain `Handle` or `metafields` named columns'\
+                .format(self.__csv_path))
+        return { col:tuple(col.split('.')[1:3]) for col in metafield_cols }
+
+    def metafield_records(self, ids, chunksize=50000):
+        """Stream the metafield records of the CSV file. Only ``Handle`` and the metafield
+        columns are read, in chunks of ``chunksize`` rows; each chunk is converted with a
+        vectorized melt and id lookup. Only the first row of a handle is used, like in
+        ``csv_to_dict()``. Handles without product id and empty cells are skipped.
+
+        Args:
+            ids (Mapping): a mapping with key: handle, value: id, e.g. ``IdIndex``
+            chunksize (int, optional): Rows per chunk. Defaults to 50000.
+
+        Yields:
+            dict: with keys id, namespace, key, value
+        """
+        import pandas as pd
+        log = logger.configure("default")
+        columns = self.metafield_columns()
+        namespaces = { col:namespace for col, (namespace, _) in columns.items() }
+        keys = { col:key for col, (_, key) in columns.items() }
+        seen = set()
+
+        reader = pd.read_csv(self.__csv_path, usecols=['Handle'] + list(columns),
+                             dtype=str, chunksize=chunksize)
+        for chunk in reader:
+            chunk = chunk.dropna(subset=['Handle']).drop_duplicates('Handle')
+            chunk = chunk[~chunk['Handle'].isin(seen)]
+            seen.update(chunk['Handle'])
+
+            handles = chunk['Handle'].str.lower()
+            if isinstance(ids, IdIndex):
+                chunk = chunk.assign(id=ids.lookup(handles.to_numpy()))
+            else:
+                chunk = chunk.assign(id=handles.map(ids))
+            missing = chunk['id'].isna()
+            if missing.any():
+                log.error('No product id for handles {}'.format(list(chunk.loc[missing, 'Handle'])))
+                chunk = chunk[~missing]
+
+            # one row per (product, metafield), grouped by product in file order
+            chunk = chunk.reset_index().melt(id_vars=['index', 'id'], value_vars=list(columns),
+                                             var_name='column', value_name='value')
+            # empty cells would be written as 'nan' metafields
+            chunk = chunk.dropna(subset=['value'])
+            chunk = chunk[chunk['value'].str.strip() != '']
+            chunk = chunk.sort_values('index', kind='stable')
+            chunk = chunk.assign(namespace=chunk['column'].map(namespaces),
+                                 key=chunk['column'].map(keys))
+            yield from chunk[['id', 'namespace', 'key', 'value']].to_dict('records')
+
     def metafields(self):
-        ids = self.product_handle_to_id()
-        products = self.csv_to_dict()
-        for product in products.items():
-            handle = product[0]
-            metafields = product[1].items()
-            for metafield in metafields:
-                metafield_attributes = metafield[0].split('.')
-                namespace, key, value = metafield_attributes[1], metafield_attributes[2], metafield[1]
-                yield {"id": ids[handle.lower()], "namespace": namespace, "key": key, "value": value}
\ No newline at end of file
+        ids = self.ids()
+        yield from self.metafield_records(ids)
+
+    def existing_metafields(self, ids, keys) -> dict:
+        """Return the stored values of the given metafields of the given products, other
+        metafields of the products are not fetched.
+
+        Args:
+            ids (list): Product ids, at most ``GetProductsMetafields.max_products(len(keys))``
+            keys (list): Metafields as tuples ``(namespace, key)``
+
+        Raises:
+            GraphQLError: When the response has errors, e.g. ``MAX_COST_EXCEEDED``
+
+        Returns:
+            dict: with key: tuple (id, namespace, key), value: metafield value
+        """
+        query = GetProductsMetafields(ids, keys, store=self.__store)
+        shopify = GraphQL(url=query.url(), headers=query.headers(), payload=query.payload())
+        body = shopify.api_request(shopify.method(), shopify.url(), data=shopify.payload(),
+                                   headers=shopify.headers()).json()
+        if body.get('errors') or not body.get('data'):
+            # comparing against nothing would report every metafield as changed
+            raise GraphQLError('Could not fetch existing metafields: {}'.format(body.get('errors')),
+                               body.get('errors'))
+        existing = {}
+        aliases = query.aliases()
+        for product in body['data']['nodes']:
+            if not product:
+                continue
+            for alias, (namespace, key) in aliases.items():
+                if product.get(alias):
+                    existing[(product['id'], namespace, key)] = product[alias]['value']
+        return existing
+
+    def changed_metafields(self, products_per_request=None):
+        """Reconciliation mode of ``metafields()``: yields only metafields which are new or
+        differ from the value stored in Shopify. Empty CSV cells are skipped. Only the
+        metafields of the CSV columns are fetched, for ``products_per_request`` products
+        at a time.
+
+        Args:
+            products_per_request (int, optional): Products per metafields query. Defaults
+                to the most products a query can request within the query cost limit.
+
+        Raises:
+            GraphQLError: When the existing metafields can't be fetched
+
+        Yields:
+            dict: with keys id, namespace, key, value
+        """
+        log = logger.configure("default")
+        keys = list(dict.fromkeys(self.metafield_columns().values()))
+        products_per_request = min(products_per_request or float('inf'),
+                                   GetProductsMetafields.max_products(len(keys)))
+        products = groupby(self.metafields(), key=lambda metafield: metafield['id'])
+        total, changed = 0, 0
+        while True:
+            batch = [(id, list(metafields)) for id, metafields in islice(products, products_per_request)]
+            if not batch:
+                break
+            existing = self.existing_metafields([id for id, _ in batch], keys)
+            for id, metafields in batch:
+                for metafield in metafields:
+                    total += 1
+                    if existing.get((id, metafield['namespace'], metafield['key'])) == metafield['value']:
+                        continue
+                    changed += 1
+                    yield metafield
+        log.info('{} of {} metafields are new or changed'.format(changed, total))
@@ -0,0 +1,175 @@
+import json
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Counter:
+    """Monotonically increasing value
+    """
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Distribution of observed values, e.g. latencies in seconds
+    """
+
+    def __init__(self, name, help='', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Registry:
+    """In-process metrics registry with Prometheus text and JSON export
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def to_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: Metrics
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            if metric.help:
+                lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            if isinstance(metric, Counter):
+                lines.append('# TYPE {} counter'.format(metric.name))
+                lines.append('{} {}'.format(metric.name, metric.value))
+            else:
+                lines.append('# TYPE {} histogram'.format(metric.name))
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), metric.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{le="{}"}} {}'.format(metric.name, bound, cumulative))
+                lines.append('{}_sum {}'.format(metric.name, metric.sum))
+                lines.append('{}_count {}'.format(metric.name, metric.count))
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        """Return all metrics as dict: counters as value, histograms with count, sum
+        and bucket counts
+
+        Returns:
+            dict: Metrics by name
+        """
+        metrics = {}
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Counter):
+                metrics[metric.name] = metric.value
+            else:
+                metrics[metric.name] = {'count': metric.count, 'sum': metric.sum,
+                                        'buckets': dict(zip([str(b) for b in metric.buckets] + ['+Inf'],
+                                                            metric.counts))}
+        return metrics
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+
+class Instrumentation:
+    """Hot-path instrumentation of Shopify sessions. Timing spans (``request``,
+    ``parse``, ``delay``, ``consumer``) are recorded as histograms
+    ``shopify_<span>_seconds``, events as counters ``shopify_<event>_total``. Hooks are
+    called with ``(name, value, fields)`` for every span and event.
+
+    Usage:
+
+    #instrumentation = Instrumentation()
+    #instrumentation.add_hook(lambda name, value, fields: print(name, value, fields))
+    #GraphQL(url=url, headers=headers, payload=payload, instrumentation=instrumentation).data()
+    #print(instrumentation.registry.to_prometheus())
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """Register a callback ``hook(name, value, fields)``
+        """
+        self._hooks.append(hook)
+
+    def observe(self, span, seconds, **fields):
+        """Record the duration of a span
+
+        Args:
+            span (str): Span name, e.g. 'request'
+            seconds (float): Duration
+        """
+        self.registry.histogram('shopify_{}_seconds'.format(span),
+                                'Time spent in {}'.format(span)).observe(seconds)
+        for hook in self._hooks:
+            hook(span, seconds, fields)
+
+    def count(self, event, amount=1, **fields):
+        """Record an event
+
+        Args:
+            event (str): Event name, e.g. 'retries'
+            amount (int, optional): Increment. Defaults to 1.
+        """
+        self.registry.counter('shopify_{}_total'.format(event)).inc(amount)
+        for hook in self._hooks:
+            hook(event, amount, fields)
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Context manager timing a span, see ``observe()``
+        """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started, **fields)
+
+
+_default = Instrumentation()
+
+def instrumentation():
+    """Return the process wide instrumentation used by all sessions unless a dedicated
+    one is passed in
+
+    Returns:
+        Instrumentation: Shared instrumentation
+    """
+    return _default
@@ -1,13 +1,26 @@
 from abc import ABC, abstractmethod
+import json
 import os
 import logger
+from templates import template
+from settings import settings
 
 class GraphQLRequest(ABC):
-    def __init__(self):
+    def __init__(self, store=None):
+        """Constructor
+
+        Args:
+            store (Store, optional): Store credentials. Defaults to the store set in the
+                environment variables ``SHOPIFY_STORENAME``, ``SHOPIFY_STORE_API_PASSWORD``
+                and ``SHOPIFY_API_VERSION``.
+        """
         super().__init__()
-        self._store = os.environ['SHOPIFY_STORENAME']
-        self._password = os.environ['SHOPIFY_STORE_API_PASSWORD']
-        self._api_version = os.environ['SHOPIFY_API_VERSION']
+        if store:
+            self._store, self._password, self._api_version = store.name, store.password, store.api_version
+        else:
+            self._store = os.environ['SHOPIFY_STORENAME']
+            self._password = os.environ['SHOPIFY_STORE_API_PASSWORD']
+            self._api_version = os.environ['SHOPIFY_API_VERSION']
         self.log = logger.configure("default")
 
     def url(self) -> str:
@@ -18,33 +31,62 @@ class GraphQLRequest(ABC):
         return {'x-shopify-access-token': self._password,'content-type': 'application/json'}
 
 class GetProductsByTag(GraphQLRequest):
-    def __init__(self, tag: str = '', number_of_products: int = 50):
-        super().__init__()
-        self._number_of_products = number_of_products
+    def __init__(self, tag: str = '', number_of_products: int = None, search: str = '', store=None):
+        """Constructor
+
+        Args:
+            tag (str, optional): Tag to filter products. Defaults to ''.
+            number_of_products (int, optional): Products per page. Defaults to ``page_size``
+                of config.yml.
+            search (str, optional): Additional search terms, e.g. an ``updated_at``
+                range. Defaults to ''.
+            store (Store, optional): Store credentials. Defaults to the environment.
+        """
+        super().__init__(store=store)
+        self._number_of_products = number_of_products or settings().page_size()
         self._tag = tag
+        self._search = search
         self.run()
 
-    def payload(self) -> str:
-        pl =    '{{'\
-                    '"query":"{{'\
-                        'products {} {{'\
-                            'edges {{'\
-                                'cursor '\
-                                'node {{ '\
-                                    'id '\
-                                    'handle'\
-                                '}}'\
-                            '}}'\
-                        '}}'\
-                    '}}"'\
-                '}}'
-        return pl
-
-    def query_filter(self) -> str:
-        return 'first: {}, query:\\\"{}\\\"'.format(self._number_of_products, self._tag)
+    def payload(self):
+        """Return the compiled query template, the page values are passed by ``variables()``
+        and the cursor of the previous page as variable ``after``.
+
+        Returns:
+            QueryTemplate: Query template
+        """
+        return template(
+            'query($first: Int!, $query: String, $after: String) {'
+                'products(first: $first, query: $query, after: $after) {'
+                    'edges {'
+                        'cursor '
+                        'node { '
+                            'id '
+                            'handle '
+                            'updatedAt'
+                        '}'
+                    '} '
+                    'pageInfo { '
+                        'hasNextPage'
+                    '}'
+                '}'
+            '}')
+
+    def variables(self) -> dict:
+        return {'first': self._number_of_products, 'query': self.search_query()}
+
+    def search_query(self) -> str:
+        return ' '.join(term for term in (self._tag, self._search) if term)
+
+    def bulk_query(self) -> str:
+        """Return the query without pagination arguments, as submitted by
+        ``bulkOperationRunQuery``
+        """
+        return '{{ products(query: {}) {{ edges {{ node {{ id handle updatedAt }} }} }} }}'\
+            .format(json.dumps(self.search_query()))
 
     def run(self):
-        """Check types of class attributes and placeholder existence ``{}``
+        """Check types of class attributes
         """
         # check input param ``number_of_products``, must be ``int``
         try:
@@ -60,18 +102,18 @@ class GetProductsByTag(GraphQLRequest):
             self.log.error('Query filter parameter tag must be of type str, received: {} (type: {})'\
                 .format(self._tag, type(self._tag)))
             raise
-
-        # check if `{}` in payload
+        # check input param ``search``, must be ``str``
         try:
-            assert '{}' in self.payload()
+            assert type(self._search) == str
         except AssertionError:
-            self.log.error('Payload String must include `\{\}`to insert Query filter, payload = {}'\
-                .format(self.payload()))
+            self.log.error('Query filter parameter search must be of type str, received: {} (type: {})'\
+                .format(self._search, type(self._search)))
             raise
 
 class CreateMetafield(GraphQLRequest):
-    def __init__(self, id: str, namespace: str, key: str, value: str, value_type: str = 'STRING' ):
-        super().__init__()
+    def __init__(self, id: str, namespace: str, key: str, value: str, value_type: str = 'STRING',
+                 store=None):
+        super().__init__(store=store)
         self._id = id
         self._namespace = namespace
         self._key = key
@@ -79,42 +121,153 @@ class CreateMetafield(GraphQLRequest):
         self._value_type = value_type 
 
     def payload(self) -> str:
-        pl = '{{'\
-                '"query":"mutation($input: ProductInput!) {{'\
-                    'productUpdate(input: $input) {{'\
-                        'product {{'\
-                            'metafields(first: 100) {{'\
-                                'edges {{' \
-                                    'node {{'\
-                                        'id '\
-                                        'namespace '\
-                                        'key '\
-                                        'value '\
-                                    '}}'\
-                                '}}'\
-                            '}}'\
-                        '}}'\
-                        'userErrors {{'\
-                            'field,'\
-                            'message'\
-                            '}}'\
-                        '}} '\
-                    '}}'\
-                '",' \
-                '"variables":'\
-                    '{{"input":'\
-                        '{{'\
-                            '"id":"{}",'\
-                            '"metafields":[{{'\
-                                '"namespace":"{}",'\
-                                '"key":"{}",'\
-                                '"value":"{}",'\
-                                '"valueType":"{}"'\
-                            '}}]'\
-                        '}}'\
-                    '}}'\
-            '}}'
-        return pl.format(self._id, self._namespace, self._key, self._value, self._value_type)
+        mutation = template(
+            'mutation($input: ProductInput!) {'
+                'productUpdate(input: $input) {'
+                    'product {'
+                        'metafields(first: 100) {'
+                            'edges {'
+                                'node {'
+                                    'id '
+                                    'namespace '
+                                    'key '
+                                    'value '
+                                '}'
+                            '}'
+                        '}'
+                    '}'
+                    'userErrors {'
+                        'field,'
+                        'message'
+                    '}'
+                '} '
+            '}')
+        return mutation.payload(input={
+            'id': self._id,
+            'metafields': [{'namespace': self._namespace, 'key': self._key,
+                            'value': str(self._value), 'valueType': self._value_type}]
+        })
+
+class UpdateProductsMetafields(GraphQLRequest):
+    """Mutation setting all metafields of several products in one request. Each product
+    gets its own aliased ``productUpdate`` (``p0``, ``p1``, ...) in a single GraphQL
+    document, all metafields of a product go into one ``ProductInput``.
+    """
+    def __init__(self, products: list, value_type: str = 'STRING', store=None):
+        """Constructor
 
+        Args:
+            products (list): List of tuples ``(id, metafields)``, metafields being a list of
+                dicts with keys ``namespace``, ``key`` and ``value``
+            value_type (str, optional): Metafield value type. Defaults to 'STRING'.
+            store (Store, optional): Store credentials. Defaults to the environment.
+        """
+        super().__init__(store=store)
+        self._products = products
+        self._value_type = value_type
+
+    def aliases(self) -> list:
+        return ['p{}'.format(i) for i in range(len(self._products))]
+
+    def payload(self) -> str:
+        # the document only depends on the number of products, it's compiled once per size
+        aliases = self.aliases()
+        arguments = ', '.join('$input{}: ProductInput!'.format(i) for i in range(len(aliases)))
+        mutations = ' '.join(
+            '{}: productUpdate(input: $input{}) {{ product {{ id }} userErrors {{ field message }} }}'
+                .format(alias, i) for i, alias in enumerate(aliases))
+        variables = {}
+        for i, (id, metafields) in enumerate(self._products):
+            variables['input{}'.format(i)] = {
+                'id': id,
+                'metafields': [{'namespace': m['namespace'], 'key': m['key'],
+                                'value': str(m['value']), 'valueType': self._value_type}
+                               for m in metafields]
+            }
+        return template('mutation({}) {{ {} }}'.format(arguments, mutations)).payload(**variables)
 
+class RunBulkOperation(GraphQLRequest):
+    """Mutation starting a bulk operation which runs ``query`` asynchronously on Shopify
+    """
+    def __init__(self, query: str, store=None):
+        super().__init__(store=store)
+        self._query = query
 
+    def payload(self) -> str:
+        return template(
+            'mutation($query: String!) { bulkOperationRunQuery(query: $query) { '
+            'bulkOperation { id status } userErrors { field message } } }'
+        ).payload(query=self._query)
+
+class CurrentBulkOperation(GraphQLRequest):
+    """Query returning status and result URL of the current bulk operation
+    """
+    def payload(self) -> str:
+        return template(
+            '{ currentBulkOperation { id status errorCode objectCount url } }'
+        ).payload()
+
+class GetProductsMetafields(GraphQLRequest):
+    """Query returning the values of given metafields of several products. Each metafield
+    is requested by ``namespace`` and ``key`` under its own alias (``m0``, ``m1``, ...),
+    so a product costs one point plus one point per metafield instead of the cost of a
+    ``metafields`` connection. A single query may request at most ``MAX_QUERY_COST``
+    points and ``MAX_NODES`` products.
+    """
+    MAX_QUERY_COST = 1000
+    MAX_NODES = 250
+
+    def __init__(self, ids: list, keys: list, store=None):
+        """Constructor
+
+        Args:
+            ids (list): Product ids
+            keys (list): Metafields as tuples ``(namespace, key)``
+            store (Store, optional): Store credentials. Defaults to the environment.
+
+        Raises:
+            ValueError: When the requested cost exceeds ``MAX_QUERY_COST``
+        """
+        super().__init__(store=store)
+        if len(ids) > self.max_products(len(keys)):
+            raise ValueError('Requested cost of {} products with {} metafields exceeds {} points'\
+                .format(len(ids), len(keys), self.MAX_QUERY_COST))
+        self._ids = ids
+        self._keys = list(keys)
+
+    @classmethod
+    def max_products(cls, number_of_metafields: int) -> int:
+        """Return the number of products a single query can request
+
+        Args:
+            number_of_metafields (int): Metafields per product
+
+        Returns:
+            int: Products per query
+        """
+        return max(1, min(cls.MAX_NODES, (cls.MAX_QUERY_COST - 1) // (number_of_metafields + 1)))
+
+    def requested_cost(self) -> int:
+        """Return the cost points of the query: one for the query, one per product and
+        one per metafield of a product
+        """
+        return 1 + len(self._ids) * (len(self._keys) + 1)
+
+    def aliases(self) -> dict:
+        """Return the ``(namespace, key)`` of each metafield alias
+        """
+        return { 'm{}'.format(i):key for i, key in enumerate(self._keys) }
+
+    def payload(self) -> str:
+        # the document only depends on the number of metafields, it's compiled once per size
+        aliases = list(self.aliases())
+        arguments = ''.join(', $namespace{0}: String!, $key{0}: String!'.format(i)
+                            for i in range(len(aliases)))
+        fields = ' '.join('{}: metafield(namespace: $namespace{}, key: $key{}) {{ value }}'
+                          .format(alias, i, i) for i, alias in enumerate(aliases))
+        variables = {'ids': self._ids}
+        for i, (namespace, key) in enumerate(self._keys):
+            variables['namespace{}'.format(i)] = namespace
+            variables['key{}'.format(i)] = key
+        return template('query($ids: [ID!]!{}) {{ nodes(ids: $ids) {{ ... on Product {{ id {} }} }} }}'
+                        .format(arguments, fields)).payload(**variables)
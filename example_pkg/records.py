@@ -0,0 +1,342 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import ItemsView, Mapping, Sequence
+
+GID_SCHEME = 'gid://'
+
+class GidColumn:
+    """Column of Shopify GIDs like ``gid://shopify/Product/123``. The prefix of a GID
+    (``gid://shopify/Product/``) is interned once per column and referenced by number,
+    the numeric id is stored in an ``array``. Values which are no numeric GIDs (None,
+    GIDs with query strings, ...) are kept as they are.
+    """
+    __slots__ = ('_prefixes', '_prefix_numbers', '_prefix', '_numbers', '_other')
+
+    def __init__(self, values=()):
+        # prefix number 0 marks values kept in ``_other``
+        self._prefixes = [None]
+        self._prefix_numbers = {}
+        self._prefix = array('H')
+        self._numbers = array('q')
+        self._other = {}
+        for value in values:
+            self.append(value)
+
+    def append(self, value):
+        if isinstance(value, str) and value.startswith(GID_SCHEME):
+            prefix, _, number = value.rpartition('/')
+            if number.isdigit():
+                prefix += '/'
+                index = self._prefix_numbers.get(prefix)
+                if index is None:
+                    index = self._prefix_numbers[prefix] = len(self._prefixes)
+                    self._prefixes.append(prefix)
+                self._prefix.append(index)
+                self._numbers.append(int(number))
+                return
+        self._other[len(self._numbers)] = value
+        self._prefix.append(0)
+        self._numbers.append(0)
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def __getitem__(self, index):
+        prefix = self._prefix[index]
+        if prefix == 0:
+            return self._other[index if index >= 0 else len(self) + index]
+        return self._prefixes[prefix] + str(self._numbers[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def numbers(self):
+        """Return the numeric ids, 0 for values which are no numeric GIDs
+
+        Returns:
+            array: Numeric ids
+        """
+        return self._numbers
+
+    def select(self, positions):
+        """Return the GIDs at ``positions`` as NumPy object array, the strings are built
+        per prefix with vectorized string operations. Requires ``numpy``.
+
+        Args:
+            positions (array-like): Positions
+
+        Returns:
+            numpy.ndarray: GIDs
+        """
+        import numpy
+        positions = numpy.asarray(positions, dtype=numpy.intp)
+        result = numpy.empty(len(positions), dtype=object)
+        if not len(positions):
+            return result
+        prefix = numpy.frombuffer(self._prefix, dtype=numpy.uint16)[positions]
+        numbers = numpy.frombuffer(self._numbers, dtype=numpy.int64)[positions]
+        for index in numpy.unique(prefix):
+            mask = prefix == index
+            if index == 0:
+                result[mask] = [self._other[position] for position in positions[mask]]
+            else:
+                result[mask] = numpy.char.add(self._prefixes[index], numbers[mask].astype(str))
+        return result
+
+    def take(self, positions):
+        """Return a new column with the values at ``positions``
+
+        Args:
+            positions (iterable): Positions, in the order of the new column
+
+        Returns:
+            GidColumn: Column
+        """
+        column = GidColumn()
+        column._prefixes = self._prefixes
+        column._prefix_numbers = self._prefix_numbers
+        for position in positions:
+            column._prefix.append(self._prefix[position])
+            column._numbers.append(self._numbers[position])
+            if self._prefix[position] == 0:
+                column._other[len(column._numbers) - 1] = self._other[position]
+        return column
+
+
+def _get(record, path):
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+class CompactRecords(Sequence):
+    """Columnar container of paginated records. Only the selected ``fields`` (dotted
+    paths like ``node.handle``) are kept; id fields are stored in a ``GidColumn``.
+    Items are rebuilt as nested dicts on access, so it can replace the list returned by
+    ``data()``.
+
+    Usage:
+
+    #products = GraphQL(url=url, headers=headers, payload=payload).data(fields=['node.id', 'node.handle'])
+    #products[0]['node']['handle']
+    #products.to_numpy()['node.id']
+    """
+    __slots__ = ('fields', '_paths', '_columns', '_length')
+
+    def __init__(self, fields, id_fields=None):
+        """Constructor
+
+        Args:
+            fields (list): Dotted paths of the kept fields, e.g. ``['node.id', 'cursor']``
+            id_fields (list, optional): Fields holding GIDs. Defaults to all fields
+                named ``id``.
+        """
+        if id_fields is None:
+            id_fields = [field for field in fields if field.rsplit('.', 1)[-1] == 'id']
+        self.fields = tuple(fields)
+        self._paths = [tuple(field.split('.')) for field in self.fields]
+        self._columns = [GidColumn() if field in id_fields else [] for field in self.fields]
+        self._length = 0
+
+    @classmethod
+    def from_records(cls, records, fields, id_fields=None):
+        """Collect ``records`` into a new container
+
+        Args:
+            records (iterable): Records, e.g. ``Shopify.records()``
+            fields (list): Dotted paths of the kept fields
+
+        Returns:
+            CompactRecords: Records
+        """
+        compact = cls(fields, id_fields)
+        compact.extend(records)
+        return compact
+
+    def append(self, record):
+        for path, column in zip(self._paths, self._columns):
+            column.append(_get(record, path))
+        self._length += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < -self._length or index >= self._length:
+            raise IndexError('record index out of range')
+        record = {}
+        for path, column in zip(self._paths, self._columns):
+            parent = record
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[path[-1]] = column[index]
+        return record
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    def column(self, field):
+        """Return the column of a field
+
+        Args:
+            field (str): Dotted path
+
+        Returns:
+            list or GidColumn: Values
+        """
+        return self._columns[self.fields.index(field)]
+
+    def to_numpy(self):
+        """Export the columns as NumPy arrays, id fields as ``int64`` numeric ids. Requires
+        ``numpy``.
+
+        Returns:
+            dict: Arrays by field
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('CompactRecords.to_numpy requires numpy, install it with `pip install numpy`')
+        return { field:numpy.frombuffer(column.numbers(), dtype=numpy.int64)
+                 if isinstance(column, GidColumn) else numpy.array(column, dtype=object)
+                 for field, column in zip(self.fields, self._columns) }
+
+    def to_arrow(self):
+        """Export the records as Arrow table with one column per field, id fields as
+        GID strings. Requires ``pyarrow``.
+
+        Returns:
+            pyarrow.Table: Table
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('CompactRecords.to_arrow requires pyarrow, install it with `pip install pyarrow`')
+        return pyarrow.table({ field:list(column) for field, column in zip(self.fields, self._columns) })
+
+
+class IdIndex(Mapping):
+    """Read-only map of keys (handles, SKUs, ...) to GIDs. Keys are kept in a sorted
+    list and looked up by bisection, GIDs in a ``GidColumn``: no hash table and no GID
+    strings are held. Behaves like the dict it replaces, the last GID of a duplicate key
+    wins.
+    """
+    __slots__ = ('_keys', '_ids', '_key_array')
+
+    def __init__(self, pairs=()):
+        """Constructor
+
+        Args:
+            pairs (iterable, optional): ``(key, gid)`` tuples or a mapping. Defaults to ().
+        """
+        if isinstance(pairs, Mapping):
+            pairs = pairs.items()
+        keys, ids = [], GidColumn()
+        for key, gid in pairs:
+            keys.append(key)
+            ids.append(gid)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        # of equal keys (adjacent after the stable sort) keep the last one
+        order = [position for number, position in enumerate(order)
+                 if number + 1 == len(order) or keys[order[number + 1]] != keys[position]]
+        self._keys = [keys[position] for position in order]
+        self._ids = ids.take(order)
+        self._key_array = None
+
+    @classmethod
+    def from_records(cls, records, key_field, id_field):
+        """Build the index of two fields of ``records``
+
+        Args:
+            records (iterable): Records or ``CompactRecords``
+            key_field (str): Dotted path of the key, e.g. ``node.handle``
+            id_field (str): Dotted path of the GID, e.g. ``node.id``
+
+        Returns:
+            IdIndex: Index
+        """
+        if isinstance(records, CompactRecords):
+            return cls(zip(records.column(key_field), records.column(id_field)))
+        key_path, id_path = tuple(key_field.split('.')), tuple(id_field.split('.'))
+        return cls((_get(record, key_path), _get(record, id_path)) for record in records)
+
+    def _position(self, key):
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return position
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        try:
+            return self._ids[self._position(key)]
+        except TypeError:
+            # keys of another type, e.g. NaN handles from pandas
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self._position(key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def items(self):
+        """Return a view of the ``(key, gid)`` pairs in key order, iterated without a
+        lookup per key
+        """
+        return _IdIndexItems(self)
+
+    def lookup(self, keys):
+        """Vectorized ``get()`` of many keys: binary search of all keys at once against
+        the sorted keys, the GIDs are built from the interned prefixes and numeric ids.
+        Requires ``numpy``.
+
+        Args:
+            keys (array-like): Keys, e.g. a column of handles
+
+        Returns:
+            numpy.ndarray: GIDs as object array, None for unknown keys
+        """
+        import numpy
+        if self._key_array is None:
+            # an array of references to the key strings, the strings aren't copied
+            self._key_array = numpy.array(self._keys, dtype=object)
+        keys = numpy.asarray(keys, dtype=object)
+        result = numpy.full(len(keys), None, dtype=object)
+        if not self._keys:
+            return result
+        positions = numpy.searchsorted(self._key_array, keys).clip(max=len(self._keys) - 1)
+        found = self._key_array[positions] == keys
+        result[found] = self._ids.select(positions[found])
+        return result
+
+    def numbers(self):
+        """Return the numeric ids in key order, see ``GidColumn.numbers()``
+
+        Returns:
+            array: Numeric ids
+        """
+        return self._ids.numbers()
+
+
+class _IdIndexItems(ItemsView):
+
+    def __iter__(self):
+        index = self._mapping
+        return zip(index._keys, index._ids)
@@ -0,0 +1,66 @@
+from json import loads
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class ParsedResponse:
+    """HTTP response which decodes its body once. ``text`` and ``json()`` are computed on
+    first access and cached, so all accessors of ``GraphQL`` and ``REST`` share a single
+    parse of the page. Uses ``orjson`` for parsing when it is installed. All other
+    attributes (``status_code``, ``headers``, ...) are taken from the wrapped response.
+    """
+
+    def __init__(self, response, instrumentation=None):
+        """Constructor
+
+        Args:
+            response (requests.Response): HTTP response
+            instrumentation (Instrumentation, optional): Records the time of the JSON
+                parse as ``parse`` span. Defaults to None.
+        """
+        self._response = response
+        self._instrumentation = instrumentation
+        self._text = None
+        self._json = None
+        self._links = None
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __bool__(self):
+        return bool(self._response)
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._response.text
+        return self._text
+
+    def json(self):
+        """Return the parsed JSON body
+
+        Returns:
+            dict: Parsed response body
+        """
+        if self._json is None:
+            if self._instrumentation is None:
+                self._json = self._parse()
+            else:
+                with self._instrumentation.span('parse'):
+                    self._json = self._parse()
+        return self._json
+
+    def _parse(self):
+        return orjson.loads(self._response.content) if orjson else loads(self.text)
+
+    @property
+    def links(self):
+        """Links of the ``Link`` header by ``rel``, parsed once
+
+        Returns:
+            dict: e.g. ``{'next': {'url': ..., 'rel': 'next'}}``
+        """
+        if self._links is None:
+            self._links = self._response.links
+        return self._links
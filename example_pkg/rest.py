@@ -1,9 +1,8 @@
 
 from shopify import Shopify
-from util import config
 from time import sleep
-from json import loads
-from requests.utils import parse_header_links
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from throttle import shared_bucket, call_limit_status
 import logger
 
 class REST(Shopify):
@@ -12,26 +11,72 @@ class REST(Shopify):
 
     #from queries_payout_transactions import url, payload, headers
     #shopify = REST(url=url, headers=headers)
+    #shopify = REST(url=url, headers=headers, fields=['id', 'amount', 'payout_id'], look_ahead=2)
 
     Args:
         Shopify (ABC): Base class for REST and GraphQL
     """
 
-    def __init__(self, url, headers, payload=None):
-        super().__init__()
+    def __init__(self, url, headers, payload=None, session_pool=None, retry_policy=None,
+                 bucket=None, call_limit=40, restore_rate=2, instrumentation=None,
+                 fields=None, limit=250, look_ahead=0):
+        """Constructor for REST/Shopify request
+
+        Args:
+            url (String): Shopify REST API URL
+            headers (dict): HTTP headers
+            payload (str, optional): Not used. Defaults to None.
+            session_pool (SessionPool, optional): Pooled HTTP sessions. Defaults to the
+                shared pool of the process.
+            retry_policy (RetryPolicy, optional): Retry/backoff policy. Defaults to None.
+            bucket (CostBucket, optional): Call limit bucket, one point per call. Defaults
+                to the bucket shared by all REST requests to the store in this process.
+            call_limit (int, optional): Bucket size until the first response reports it.
+                Defaults to 40.
+            restore_rate (int, optional): Calls leaking per second, 4 on Shopify Plus.
+                Defaults to 2.
+            instrumentation (Instrumentation, optional): Metrics and hooks. Defaults to
+                the shared instrumentation of the process.
+            fields (list, optional): Object fields to return (``fields=`` projection),
+                all fields if None. Defaults to None.
+            limit (int, optional): Objects per page, None keeps the limit of the URL.
+                Defaults to 250, the maximum of the REST API.
+            look_ahead (int, optional): Pages to prefetch while the current page is
+                consumed, see ``Shopify.prefetch_session()``. Defaults to 0.
+        """
+        super().__init__(session_pool=session_pool, retry_policy=retry_policy,
+                         instrumentation=instrumentation)
         self.log = logger.configure("default")
-        self.__url = url
+        self.__fields = ','.join(fields) if fields else None
+        self.__limit = limit
+        self.__url = self._with_params(url)
         self.__headers = headers
+        self._look_ahead = look_ahead
+        self._restore_rate = restore_rate
+        self._bucket = bucket or shared_bucket('rest:' + url.split('/')[2], call_limit, restore_rate)
         
     def method(self):
         return 'GET'
     
+    def _with_params(self, url):
+        """Add ``limit`` and ``fields`` to ``url`` unless it sets them already
+        """
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        names = {name for name, _ in query}
+        given = len(query)
+        if self.__limit and 'limit' not in names:
+            query.append(('limit', str(self.__limit)))
+        if self.__fields and 'fields' not in names:
+            query.append(('fields', self.__fields))
+        if len(query) == given:
+            return url
+        return urlunsplit(parts._replace(query=urlencode(query, safe=',')))
+
     def url(self, response=None):
         try:
-            link = response.headers['Link']
-            #last element in list contains next link
-            u = parse_header_links(link)[-1]['url'] 
-            return u
+            # the ``Link`` header is parsed once per response, see ``ParsedResponse.links``
+            return self._with_params(response.links['next']['url'])
         except (KeyError, AttributeError):
             return self.__url
 
@@ -42,7 +87,7 @@ class REST(Shopify):
         return self.__headers
 
     def json_data(self, response=None):
-        data = loads(response.text)
+        data = response.json()
         try:   
             first_key_of_dict = next(iter(data))  
         except:
@@ -51,23 +96,40 @@ class REST(Shopify):
         return data[first_key_of_dict]
 
     def has_next(self, response=None):
-        try:
-            link = response.headers['Link']
-            rel = parse_header_links(link)[-1]['rel'] #last element in list contains next link
-        except KeyError:
-            return False
-
-        if (response == None) or (rel == 'next'):
+        if response is None:
             return True
-        else:
-            return False
+        return 'next' in response.links
+
+    def pages(self, look_ahead=0):
+        """See ``Shopify.pages()``, prefetches ``look_ahead`` of the constructor by default
+        """
+        return super().pages(look_ahead or self._look_ahead)
+
+    def _request_cost(self):
+        # every call costs one point of the call limit bucket
+        return 1
+
+    def _settle(self, reserved, response):
+        """Synchronize the call limit bucket with the ``X-Shopify-Shop-Api-Call-Limit``
+        header of the response
+        """
+        header = response.headers.get('X-Shopify-Shop-Api-Call-Limit') if response else None
+        self._bucket.settle(reserved, call_limit_status(header, self._restore_rate))
 
     def delay(self, response):
-        sleep(1)
-        self.log.debug('Slept 1 sec. Continuing to request data')
-    
+        time_to_sleep = self.delay_seconds(response)
+        if time_to_sleep:
+            sleep(time_to_sleep)
+            self.log.debug('Slept {:.2f} sec. Continuing to request data'.format(time_to_sleep))
 
-    
+    def delay_seconds(self, response):
+        """Return the time until the call limit bucket admits the next request. Bursts
+        pass without delay while the bucket has capacity.
 
-    
-    
\ No newline at end of file
+        Args:
+            response (HTTP Response): Result of a REST request to Shopify
+
+        Returns:
+            float: Seconds to wait before the next request
+        """
+        return self._bucket.wait_time(1)
@@ -0,0 +1,143 @@
+import random
+from datetime import datetime, timezone
+from settings import settings
+
+NETWORK = 'network'
+THROTTLED = 'throttled'
+SERVER = 'server'
+CLIENT = 'client'
+
+class RetryError(Exception):
+    """Raised when a request failed and can't or shouldn't be retried any more
+
+    Attributes:
+        kind (str): Error class, one of ``network``, ``throttled``, ``server``, ``client``
+        response (ParsedResponse): Last response, None for network errors
+        attempts (int): Number of requests sent
+    """
+
+    def __init__(self, message, kind, response=None, attempts=0):
+        super().__init__(message)
+        self.kind = kind
+        self.response = response
+        self.attempts = attempts
+
+
+class RetryPolicy:
+    """Classifies failed Shopify requests and computes the wait time before a retry.
+
+    * network errors and 5xx responses are retried with exponential backoff and jitter
+    * 429 responses are retried after ``Retry-After``, or when the REST bucket of
+      ``X-Shopify-Shop-Api-Call-Limit`` has leaked a call
+    * GraphQL responses with a ``THROTTLED`` error (HTTP 200) are retried when the
+      requested query cost has been restored
+    * other 4xx responses are not retried
+
+    The total wait time of a request is capped by ``max_wait``.
+    """
+
+    def __init__(self, max_retries=None, backoff=None, max_wait=None, jitter=0.25,
+                 rest_leak_rate=2):
+        """Constructor
+
+        Args:
+            max_retries (int, optional): Max. requests per call. Defaults to ``max_retries``
+                of config.yml.
+            backoff (float, optional): Wait before the first retry in seconds, doubled
+                for every retry. Defaults to ``backoff`` of config.yml.
+            max_wait (float, optional): Max. total wait in seconds. Defaults to
+                ``max_wait`` of config.yml.
+            jitter (float, optional): Relative random variation of backoff waits. Defaults to 0.25.
+            rest_leak_rate (int, optional): REST calls leaking per second. Defaults to 2.
+        """
+        self.max_retries = max_retries or settings().max_retries()
+        self.backoff = backoff or settings().backoff()
+        self.max_wait = max_wait or settings().max_wait()
+        self.jitter = jitter
+        self.rest_leak_rate = rest_leak_rate
+
+    def classify(self, response=None, error=None):
+        """Classify the outcome of a request
+
+        Args:
+            response (ParsedResponse, optional): Response. Defaults to None.
+            error (Exception, optional): Exception raised by the request. Defaults to None.
+
+        Returns:
+            tuple: ``(kind, wait)``; kind is None for a successful response, wait is
+            the wait time demanded by the server or None
+        """
+        if error is not None:
+            return NETWORK, None
+        if response.status_code == 429:
+            return THROTTLED, self._retry_after(response) or self._call_limit_wait(response)
+        if response.status_code >= 500:
+            return SERVER, self._retry_after(response)
+        if response.status_code >= 400:
+            return CLIENT, None
+        return self._graphql_throttled(response)
+
+    def retryable(self, kind):
+        return kind in (NETWORK, THROTTLED, SERVER)
+
+    def wait_time(self, attempt, hint=None):
+        """Return the wait time before retry number ``attempt`` (starting at 0)
+
+        Args:
+            attempt (int): Number of the retry
+            hint (float, optional): Wait time demanded by the server. Defaults to None.
+
+        Returns:
+            float: Seconds
+        """
+        if hint is not None:
+            # the server knows best, add a little jitter to avoid a thundering herd
+            return hint + random.uniform(0, self.jitter)
+        wait = self.backoff * 2 ** attempt
+        return wait * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        # HTTP-date form, rare enough to import the parser on demand
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def _call_limit_wait(self, response):
+        value = response.headers.get('X-Shopify-Shop-Api-Call-Limit')
+        if not value:
+            return None
+        try:
+            used, limit = (int(number) for number in value.split('/'))
+        except ValueError:
+            return None
+        return max(1, used - limit + 1) / self.rest_leak_rate
+
+    def _graphql_throttled(self, response):
+        if 'json' not in response.headers.get('Content-Type', 'application/json'):
+            return None, None
+        try:
+            body = response.json()
+        except ValueError:
+            return None, None
+        if not isinstance(body, dict):
+            return None, None
+        errors = body.get('errors') or []
+        if not isinstance(errors, list) or not any(
+                (error.get('extensions') or {}).get('code') == 'THROTTLED' for error in errors):
+            return None, None
+        try:
+            cost = body['extensions']['cost']
+            status = cost['throttleStatus']
+            return THROTTLED, max(0.0, (cost['requestedQueryCost'] - status['currentlyAvailable'])
+                                  / status['restoreRate'])
+        except (KeyError, TypeError, ZeroDivisionError):
+            return THROTTLED, None
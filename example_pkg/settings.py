@@ -0,0 +1,134 @@
+import os
+from threading import Lock
+
+DEFAULTS = {
+    'general': {
+        'max_cost_points': '1000',
+        'leak_rate': '50',
+        'page_size': '50',
+    },
+    'retry': {
+        'max_retries': '5',
+        'backoff': '1',
+        'max_wait': '60',
+    },
+}
+
+class Settings:
+    """Configuration from ``config.yml``, loaded once and cached. Values can be
+    overridden by environment variables named ``SHOPIFY_<SECTION>_<KEY>``, e.g.
+    ``SHOPIFY_GENERAL_LEAK_RATE=100``. Missing values fall back to ``DEFAULTS``.
+    """
+
+    def __init__(self, path='config.yml'):
+        """Constructor
+
+        Args:
+            path (str, optional): YAML configuration file. Defaults to 'config.yml'.
+        """
+        self._path = path
+        self._lock = Lock()
+        self._values = None
+        self._mtime = None
+
+    def _mtime_of_file(self):
+        try:
+            return os.stat(self._path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        import logger
+        import yaml
+        values = {section: dict(keys) for section, keys in DEFAULTS.items()}
+        try:
+            with open(self._path, 'r') as ymlfile:
+                loaded = yaml.load(ymlfile, Loader=yaml.BaseLoader) or {}
+        except FileNotFoundError:
+            logger.configure('default').error('Could not find configuration file {}'.format(self._path))
+            loaded = {}
+        for section, keys in loaded.items():
+            if isinstance(keys, dict):
+                values.setdefault(section, {}).update(keys)
+            else:
+                values[section] = keys
+        for section, keys in values.items():
+            if isinstance(keys, dict):
+                for key in keys:
+                    env = 'SHOPIFY_{}_{}'.format(section, key).upper()
+                    if env in os.environ:
+                        keys[key] = os.environ[env]
+        return values
+
+    def values(self):
+        """Return all values, load the file on first use
+
+        Returns:
+            dict: Values by section
+        """
+        if self._values is None:
+            with self._lock:
+                if self._values is None:
+                    self._mtime = self._mtime_of_file()
+                    self._values = self._load()
+        return self._values
+
+    def reload(self):
+        """Load the file again
+        """
+        with self._lock:
+            self._mtime = self._mtime_of_file()
+            self._values = self._load()
+
+    def reload_if_changed(self):
+        """Load the file again if it was modified since it was loaded
+
+        Returns:
+            bool: True if the file was reloaded
+        """
+        if self._values is not None and self._mtime_of_file() == self._mtime:
+            return False
+        self.reload()
+        return True
+
+    def get(self, section, key, type=str):
+        """Return a single value
+
+        Args:
+            section (str): Section, e.g. 'general'
+            key (str): Key within the section
+            type (callable, optional): Conversion of the value. Defaults to str.
+
+        Returns:
+            Value converted by ``type``
+        """
+        return type(self.values()[section][key])
+
+    def max_cost_points(self):
+        return self.get('general', 'max_cost_points', int)
+
+    def leak_rate(self):
+        return self.get('general', 'leak_rate', int)
+
+    def page_size(self):
+        return self.get('general', 'page_size', int)
+
+    def max_retries(self):
+        return self.get('retry', 'max_retries', int)
+
+    def backoff(self):
+        return self.get('retry', 'backoff', float)
+
+    def max_wait(self):
+        return self.get('retry', 'max_wait', float)
+
+
+_settings = Settings()
+
+def settings():
+    """Return the process wide settings of ``config.yml``
+
+    Returns:
+        Settings: Cached settings
+    """
+    return _settings
@@ -0,0 +1,180 @@
+from queue import Queue, Full
+from threading import Thread, Event
+import logger
+from records import CompactRecords
+
+_DONE = object()
+
+def _ranges(field, bounds):
+    # the first range is open to the past and the last one open to the future
+    terms = []
+    for i in range(len(bounds) + 1):
+        term = []
+        if i > 0:
+            term.append('{}:>={}'.format(field, bounds[i - 1]))
+        if i < len(bounds):
+            term.append('{}:<{}'.format(field, bounds[i]))
+        terms.append(' '.join(term))
+    return terms
+
+def _time_bounds(start, end, shards):
+    step = (end - start) / shards
+    return ["'{}'".format((start + step * i).strftime('%Y-%m-%dT%H:%M:%SZ')) for i in range(1, shards)]
+
+def created_at_ranges(start, end, shards):
+    """Split the time range ``[start, end)`` into ``shards`` search terms on
+    ``created_at``. The first range is open to the past and the last one open to the
+    future, so no record is missed. ``created_at`` never changes, every record is in
+    exactly one shard.
+
+    Args:
+        start (datetime): Start of the range
+        end (datetime): End of the range
+        shards (int): Number of ranges
+
+    Returns:
+        list: Search terms, e.g. ``"created_at:>='2020-01-01T00:00:00Z' created_at:<'...'"``
+    """
+    return _ranges('created_at', _time_bounds(start, end, shards))
+
+def id_ranges(start, end, shards):
+    """Split the numeric id range ``[start, end)`` into ``shards`` search terms on
+    ``id``, open to smaller and larger ids at the ends. Ids never change, every record
+    is in exactly one shard.
+
+    Args:
+        start (int): Smallest numeric id, e.g. of the oldest product
+        end (int): Largest numeric id
+        shards (int): Number of ranges
+
+    Returns:
+        list: Search terms, e.g. ``'id:>=1000 id:<2000'``
+    """
+    step = (end - start) / shards
+    return _ranges('id', [start + int(step * i) for i in range(1, shards)])
+
+def updated_at_ranges(start, end, shards):
+    """Split the time range ``[start, end)`` into ``shards`` search terms on
+    ``updated_at``, see ``created_at_ranges()``.
+
+    Sharding on ``updated_at`` is racy: a record updated while the shards run moves to
+    the last shard, it is missed if that shard has already passed it, or returned
+    twice. Use it only when the store isn't written to, otherwise prefer
+    ``created_at_ranges()`` or ``id_ranges()``.
+
+    Returns:
+        list: Search terms, e.g. ``"updated_at:>='2020-01-01T00:00:00Z' updated_at:<'...'"``
+    """
+    return _ranges('updated_at', _time_bounds(start, end, shards))
+
+
+class ShardedGraphQL:
+    """Runs several independent cursor paginations (shards) of a list query
+    concurrently and merges their records into one stream. Each shard is a ``GraphQL``
+    request whose ``query:`` filter covers a disjoint part of the keyspace of an
+    immutable key, e.g. a ``created_at`` range from ``created_at_ranges()``. Shards of the same store share
+    its cost bucket (see ``throttle.shared_bucket``), so they run within one budget.
+
+    Usage:
+
+    #shards = []
+    #for search in created_at_ranges(datetime(2015, 1, 1), datetime.now(), 8):
+    #    query = GetProductsByTag(tag='summer', search=search)
+    #    shards.append(GraphQL(url=query.url(), headers=query.headers(),
+    #                          payload=query.payload(), variables=query.variables()))
+    #products = ShardedGraphQL(shards).data()
+    """
+
+    def __init__(self, shards, ordered=False, look_ahead=4):
+        """Constructor
+
+        Args:
+            shards (list): ``GraphQL`` requests, one per shard
+            ordered (bool, optional): Yield all records of a shard before the records of
+                the next shard. Defaults to False (records are yielded as they arrive).
+            look_ahead (int, optional): Pages buffered per shard. Defaults to 4.
+        """
+        self.log = logger.configure("default")
+        self._shards = shards
+        self._ordered = ordered
+        self._look_ahead = look_ahead
+
+    def _put(self, queue, item, stop):
+        # give up when the consumer stopped iterating or another shard failed
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _fetch(self, number, shard, queue, stop):
+        try:
+            for json_data in shard.session():
+                if not self._put(queue, (number, shard.page_records(json_data)), stop):
+                    self.log.debug('Shard #{} cancelled'.format(number))
+                    return
+        except Exception as e:
+            self.log.error('Shard #{} failed: {}'.format(number, e))
+            self._put(queue, (number, e), stop)
+            return
+        self._put(queue, (number, _DONE), stop)
+
+    def session(self):
+        """Run all shards and yield their pages
+
+        Yields:
+            List of Dicts -- Records of a page
+        """
+        if self._ordered:
+            queues = [Queue(self._look_ahead) for _ in self._shards]
+        else:
+            queues = [Queue(self._look_ahead * len(self._shards))] * len(self._shards)
+        stop = Event()
+        for number, (shard, queue) in enumerate(zip(self._shards, queues)):
+            Thread(target=self._fetch, args=(number, shard, queue, stop), daemon=True).start()
+
+        running = len(self._shards)
+        current = 0
+        try:
+            while running:
+                number, item = queues[current].get()
+                if item is _DONE:
+                    running -= 1
+                    self.log.debug('Shard #{} done, {} shards running'.format(number, running))
+                    if self._ordered:
+                        current += 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # cancel the remaining shards
+            stop.set()
+
+    def records(self):
+        """Yield the merged records of all shards one at a time
+
+        Yields:
+            Dict -- A single record
+        """
+        for page in self.session():
+            yield from page
+
+    def data(self, fields=None):
+        """Return the merged records of all shards
+
+        Args:
+            fields (list, optional): Dotted paths of the fields to keep, see
+                ``Shopify.data()``. Defaults to None.
+
+        Returns:
+            List of Dicts -- All records
+        """
+        if fields:
+            data = CompactRecords.from_records(self.records(), fields)
+        else:
+            data = list(self.records())
+        self.log.debug("Shards returned a total of {} records".format(len(data)))
+        return data
@@ -1,16 +1,30 @@
 from abc import ABC, abstractmethod
-import requests
+from connection import default_pool
+from response import ParsedResponse
 import logger
+import logging
 import json
-from util import config
-from pprint import pprint
+from retry import RetryPolicy, RetryError
 from time import sleep
+from queue import Queue, Full
+from threading import Thread, Event
+from time import perf_counter
+import metrics
+from records import CompactRecords
+
+# steps of ``Shopify.pagination()``
+REQUEST = 'request'
+PAGE = 'page'
+DELAY = 'delay'
 
 class Shopify(ABC):
 
-    def __init__(self, max_retries=5):
+    def __init__(self, max_retries=None, session_pool=None, retry_policy=None,
+                 instrumentation=None):
         super().__init__()
-        self.__max_retries = max_retries
+        self._retry_policy = retry_policy or RetryPolicy(max_retries=max_retries)
+        self._session_pool = session_pool or default_pool()
+        self._instrumentation = instrumentation or metrics.instrumentation()
         self.log = logger.configure("default")
 
     @abstractmethod
@@ -95,35 +109,106 @@ class Shopify(ABC):
 
     def api_request(self, *args, **kwargs):
         """Create a single HTTP network request to Shopify. Abstracts from the kind of request 
-        which couls be GraphQL or REST. In case of connection issues repeat request a certain 
-        number of times, after waiting a couple of seconds. Starting from 1s delay, after each 
-        failure the waiting time is doubled.
+        which couls be GraphQL or REST. The request is admitted by the cost bucket of the
+        request class first (see ``_request_cost()``). Failed requests are classified and
+        retried by ``self._retry_policy`` (see ``retry.RetryPolicy``): network errors and
+        5xx with exponential backoff and jitter, 429 and GraphQL ``THROTTLED`` errors
+        after the time demanded by Shopify. Requests are sent through the pooled
+        session of ``self._session_pool`` to reuse keep-alive connections, or through
+        any transport with the same ``request()`` method (see ``transport``).
+
+        Raises:
+            RetryError: When the request failed and can't be retried any more
 
         Returns:
-            Dict -- complete JSON data of the response loaded into a dict
+            ParsedResponse -- HTTP response, which parses its JSON body only once
         """
-        retries_count, wait_seconds = 0, 1
-        while retries_count < self.__max_retries:
-            response = requests.request(*args, **kwargs)
-
-            if response.status_code == 200:
-                return response
-            else:
-                # request failed. Try again, but wait a bit
-                self.log.debug(
-                    "Delaying next Shopify query for {} seconds".format(wait_seconds)
-                )
+        cost = self._request_cost()
+        reserved = self._bucket.acquire(cost) if cost is not None else None
+        response = None
+        try:
+            attempts, waited = 0, 0.0
+            while True:
+                attempts += 1
+                response, error = self._send(*args, **kwargs)
+                wait_seconds = self._retry_wait(attempts, waited, response, error, args[1])
+                if wait_seconds is None:
+                    return response
                 sleep(wait_seconds)
-                response = requests.request(*args, **kwargs)
-                wait_seconds *= 2
-                retries_count += 1
+                waited += wait_seconds
+        finally:
+            if reserved is not None:
+                self._settle(reserved, response)
+
+    def _request_cost(self):
+        """Return the cost points the next request reserves in ``self._bucket``, None if
+        requests are not admitted by a bucket
+        """
+        return None
+
+    def _settle(self, reserved, response):
+        """Release the points reserved for a request, ``response`` is None if the request
+        failed
+        """
+        pass
+
+    def _send(self, *args, **kwargs):
+        """Send a single request, without retries
+
+        Returns:
+            tuple: ``(response, error)``, the ``RequestException`` of a network error
+        """
+        from requests.exceptions import RequestException
+        instrumentation = self._instrumentation
+        response, error = None, None
+        started = perf_counter()
+        try:
+            response = ParsedResponse(self._session_pool.request(*args, **kwargs),
+                                      instrumentation)
+        except RequestException as e:
+            error = e
+        instrumentation.observe('request', perf_counter() - started, url=args[1])
+        instrumentation.count('requests')
+        if response is not None:
+            instrumentation.count('bytes_received', len(response.content))
+        return response, error
+
+    def _retry_wait(self, attempts, waited, response, error, url):
+        """Decide about the retry of a request, see ``api_request()``
+
+        Args:
+            attempts (int): Requests sent so far
+            waited (float): Seconds waited for retries so far
+            response (ParsedResponse): Response of the last request, None on network errors
+            error (Exception): Network error of the last request
+            url (str): Requested URL
 
-        self.log.error(
-            "Tried {} times to submit a Shopify query to {}. Waited {} seconds between "\
-            "last two queries. Failed with HTTP return code {}"\
-                .format(retries_count, args[1], wait_seconds / 2, response.status_code
-            )
-        )
+        Raises:
+            RetryError: When the request failed and can't be retried any more
+
+        Returns:
+            float: Seconds to wait before the next attempt, None if the request succeeded
+        """
+        policy = self._retry_policy
+        kind, hint = policy.classify(response, error)
+        if kind is None:
+            return None
+
+        wait_seconds = policy.wait_time(attempts - 1, hint)
+        status = error if error is not None else 'HTTP {}'.format(response.status_code)
+        if not policy.retryable(kind) or attempts >= policy.max_retries \
+                or waited + wait_seconds > policy.max_wait:
+            self.log.error(
+                "Tried {} times to submit a Shopify query to {}, waited {:.1f} seconds. "\
+                "Failed with {} ({})".format(attempts, url, waited, status, kind))
+            raise RetryError('Request to {} failed with {}'.format(url, status),
+                             kind, response, attempts)
+
+        self.log.debug("Request failed with {} ({}). Delaying next Shopify query for "\
+            "{:.2f} seconds".format(status, kind, wait_seconds))
+        self._instrumentation.count('retries', kind=kind)
+        self._instrumentation.observe('retry_wait', wait_seconds)
+        return wait_seconds
 
     def session(self):
         """Cursor based query of Shopify resource data. Queries the first n records -
@@ -133,62 +218,202 @@ class Shopify(ABC):
         Yields:
             List of Dicts -- Generator yielded data
         """
+        steps = self.pagination()
+        step, result = next(steps), None
+        while True:
+            action, value = step
+            if action == REQUEST:
+                method, url, payload, headers = value
+                result = self.api_request(method, url, data=payload, headers=headers)
+            elif action == PAGE:
+                yield value
+                result = None
+            else:
+                self.delay(value)
+                result = None
+            try:
+                step = steps.send(result)
+            except StopIteration:
+                return
+
+    def pagination(self):
+        """Pagination steps of ``session()`` without I/O, shared by the blocking and
+        the asyncio session (see ``async_shopify``). Yields ``(REQUEST, (method, url,
+        payload, headers))`` and expects the response to be sent back, yields ``(PAGE,
+        json_data)`` for the caller to pass on and ``(DELAY, response)`` for the throttle
+        delay before the next request.
+
+        Yields:
+            tuple: ``(action, value)``
+        """
         method, url, payload, headers = self.method(), self.url(),\
                                         self.payload(), self.headers()
-        has_next = True
         counter = 0
-        
-        # there is more data which could be obtained by an API request. 
-        while has_next:
+        instrumentation = self._instrumentation
+
+        # there is more data which could be obtained by an API request.
+        while True:
             counter = counter + 1
             self.log.info("Initiate single API request #{}".format(counter))
-            response = self.api_request(method, url, data=payload, headers=headers)
-            #self.log.debug('response={}'.format(response))
-            self.log.debug('response.text={}'.format(response.text))
-            yield self.json_data(response)
-
-            if self.has_next(response):
-                self.delay(response)
-                url, payload = self.url(response), self.payload(response)
-                self.log.debug("has_next = {}. Getting next piece of data from {}"\
-                    .format(has_next, url))
-            else:
-                has_next = False
+            response = yield REQUEST, (method, url, payload, headers)
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug('response.text={}'.format(response.text))
+            # the JSON body is parsed once, timed by ``ParsedResponse`` as ``parse`` span
+            json_data = self.json_data(response)
+            has_next = self.has_next(response)
+            instrumentation.count('pages')
+            yielded = perf_counter()
+            yield PAGE, json_data
+            instrumentation.observe('consumer', perf_counter() - yielded)
+
+            if not has_next:
                 self.log.debug("No additional data available. Done with Shopify requests in current Session")
+                return
+            with instrumentation.span('delay'):
+                yield DELAY, response
+            url, payload = self.url(response), self.payload(response)
+            self.log.debug("has_next = {}. Getting next piece of data from {}"\
+                .format(has_next, url))
+
+    def prefetch_session(self, look_ahead=2):
+        """Like ``session()``, but the pages are fetched in a background thread. While
+        the caller processes page N, the next pages are requested (as soon as the cursor
+        is known and the throttle allows), up to ``look_ahead`` pages ahead.
 
-    def data(self):
+        Args:
+            look_ahead (int, optional): Max. number of fetched, unconsumed pages. Defaults to 2.
+
+        Yields:
+            List of Dicts -- Generator yielded data
+        """
+        pages = Queue(look_ahead)
+        stop = Event()
+
+        def put(item):
+            # give up when the consumer stopped iterating
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def fetch():
+            try:
+                for json_data in self.session():
+                    if not put((json_data, None)):
+                        return
+            except Exception as e:
+                put((None, e))
+                return
+            put((StopIteration, None))
+
+        Thread(target=fetch, daemon=True).start()
+        try:
+            while True:
+                json_data, error = pages.get()
+                if error:
+                    raise error
+                if json_data is StopIteration:
+                    return
+                yield json_data
+        finally:
+            stop.set()
+
+    def pages(self, look_ahead=0):
+        """Return ``session()``, or ``prefetch_session()`` if ``look_ahead`` is set
+        """
+        return self.prefetch_session(look_ahead) if look_ahead else self.session()
+
+    def data(self, fields=None):
             """Wrapper to fetch all requested Shopify data packing it into a 
             list of dicts. Initiate all requests and return the complete data.
 
+            Args:
+                fields (list, optional): Dotted paths of the fields to keep, e.g.
+                    ``['node.id', 'node.handle']``. The records are collected in a
+                    memory-compact ``CompactRecords`` then. Defaults to None.
+
             Returns:
                 List of Dicts -- All requested data collected from a number of requests
             """
             #self.log.debug("Starting to request data from Shopify")
-            data = []
-            error_log = []
-
-            for json_data in self.session():
-                if type(json_data) == list:
-                    data.extend(json_data)
-
-                if type(json_data) == dict:
-                    try:
-                        assert json_data['userErrors'] == []
-                    except AssertionError:
-                        error_log.append(json_data)
-                        self.log.error('Query has errors: {}'.format(json_data['userErrors'][0]['message']))
-                    except KeyError as e:
-                        self.log.error('No mutation or `userErrors` missing in query'.format(e))
-                        raise
-
-                    data.append(json_data)
-                    # write data with errors
-                    if error_log:
-                        with open('data/error.log', 'a+', encoding='utf-8') as f:
-                            json.dump(data, f, ensure_ascii=False, indent=4)
-                        self.log.error('Could not output all queried data. Check `data/error.log`.')
-            
+            if fields:
+                data = CompactRecords.from_records(self.records(), fields)
+            else:
+                data = list(self.records())
             self.log.debug("Shopify returned a total of {} records:".format(len(data),data))
 
             return data
 
+    def records(self, look_ahead=0):
+        """Streaming counterpart of ``data()``: yields the records one at a time, only a
+        single page is held in memory.
+
+        Args:
+            look_ahead (int, optional): Pages to prefetch while the records of the
+                current page are consumed, see ``prefetch_session()``. Defaults to 0.
+
+        Yields:
+            Dict -- A single record (query node or mutation result)
+        """
+        for json_data in self.pages(look_ahead):
+            yield from self.page_records(json_data)
+
+    def stream_to(self, sink, look_ahead=0):
+        """Write all records to ``sink``, the sink is flushed after every page
+
+        Args:
+            sink (Sink): Output sink, e.g. ``sinks.JSONLSink``
+            look_ahead (int, optional): Pages to prefetch while the current page is
+                written, see ``prefetch_session()``. Defaults to 0.
+
+        Returns:
+            int: Number of written records
+        """
+        count = 0
+        for json_data in self.pages(look_ahead):
+            records = self.page_records(json_data)
+            sink.write(records)
+            sink.flush()
+            count += len(records)
+        self.log.debug("Wrote a total of {} records to {}".format(count, sink))
+        return count
+
+    def page_records(self, json_data):
+        """Return the records of a single page. Mutation results with ``userErrors``
+        are appended to ``data/error.log``, once per result.
+
+        Args:
+            json_data (list or dict): API object data of a page, see ``json_data()``
+
+        Returns:
+            List of Dicts -- Records of the page
+        """
+        if type(json_data) == list:
+            return json_data
+
+        if type(json_data) == dict:
+            try:
+                assert json_data['userErrors'] == []
+            except AssertionError:
+                self.log.error('Query has errors: {}'.format(json_data['userErrors'][0]['message']))
+                self.log_errors([json_data])
+            except KeyError as e:
+                self.log.error('No mutation or `userErrors` missing in query'.format(e))
+                raise
+            return [json_data]
+
+        return []
+
+    def log_errors(self, records):
+        """Append records with errors to ``data/error.log``, one JSON document per line
+
+        Args:
+            records (List of Dicts): Records with errors
+        """
+        with open('data/error.log', 'a+', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.log.error('Could not output all queried data. Check `data/error.log`.')
@@ -0,0 +1,146 @@
+from abc import ABC, abstractmethod
+import csv
+import json
+
+def flatten(record, prefix=''):
+    """Flatten nested dicts into a single level dict with dotted keys, e.g.
+    ``{'node': {'id': 1}}`` becomes ``{'node.id': 1}``
+
+    Args:
+        record (dict): Record
+        prefix (str, optional): Key prefix. Defaults to ''.
+
+    Returns:
+        dict: Flat record
+    """
+    flat = {}
+    for key, value in record.items():
+        key = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, key + '.'))
+        else:
+            flat[key] = value
+    return flat
+
+
+class Sink(ABC):
+    """Output for streamed records, see ``Shopify.stream_to()``. Sinks are context
+    managers, leaving the context closes the output.
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @abstractmethod
+    def write(self, records):
+        """Write records
+
+        Args:
+            records (List of Dicts): Records of a page
+        """
+        pass
+
+    @abstractmethod
+    def flush(self):
+        """Flush written records to disk
+        """
+        pass
+
+    @abstractmethod
+    def close(self):
+        """Flush and close the output
+        """
+        pass
+
+
+class JSONLSink(Sink):
+    """Write records as JSON lines
+    """
+
+    def __init__(self, path, mode='w'):
+        super().__init__(path)
+        self._file = open(path, mode, encoding='utf-8')
+
+    def write(self, records):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CSVSink(Sink):
+    """Write flattened records as CSV rows. Columns are taken from ``fieldnames`` or
+    from the first record written; keys missing in a record are left empty, keys not
+    in the columns are ignored.
+    """
+
+    def __init__(self, path, fieldnames=None, mode='w'):
+        super().__init__(path)
+        self._file = open(path, mode, encoding='utf-8', newline='')
+        self._fieldnames = fieldnames
+        self._writer = None
+
+    def write(self, records):
+        for record in records:
+            row = flatten(record)
+            if self._writer is None:
+                self._writer = csv.DictWriter(self._file, fieldnames=self._fieldnames or list(row),
+                                              extrasaction='ignore')
+                self._writer.writeheader()
+            self._writer.writerow(row)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink(Sink):
+    """Write flattened records to a Parquet file, one row group per page. Requires
+    ``pyarrow``.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('ParquetSink requires pyarrow, install it with `pip install pyarrow`')
+        self._pyarrow = pyarrow
+        self._writer = None
+        self._schema = None
+
+    def write(self, records):
+        if not records:
+            return
+        rows = [flatten(record) for record in records]
+        if self._schema is None:
+            table = self._pyarrow.Table.from_pylist(rows)
+            self._schema = table.schema
+            self._writer = self._pyarrow.parquet.ParquetWriter(self._path, self._schema)
+        else:
+            table = self._pyarrow.Table.from_pylist(rows, schema=self._schema)
+        self._writer.write_table(table)
+
+    def flush(self):
+        # every write() is a complete row group
+        pass
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from time import perf_counter
+import logger
+
+class Store:
+    """Credentials of a Shopify store, see ``queries.GraphQLRequest``
+    """
+
+    def __init__(self, name, password, api_version):
+        """Constructor
+
+        Args:
+            name (str): Store name, the subdomain of ``myshopify.com``
+            password (str): Admin API access token
+            api_version (str): API version, e.g. '2021-01'
+        """
+        self.name = name
+        self.password = password
+        self.api_version = api_version
+
+    def __repr__(self):
+        return 'Store({!r})'.format(self.name)
+
+    @classmethod
+    def from_env(cls):
+        """Return the store set in the environment variables ``SHOPIFY_STORENAME``,
+        ``SHOPIFY_STORE_API_PASSWORD`` and ``SHOPIFY_API_VERSION``
+        """
+        return cls(os.environ['SHOPIFY_STORENAME'], os.environ['SHOPIFY_STORE_API_PASSWORD'],
+                   os.environ['SHOPIFY_API_VERSION'])
+
+
+def _timed(job, store):
+    started = perf_counter()
+    try:
+        return {'result': job(store), 'error': None, 'seconds': perf_counter() - started}
+    except Exception as e:
+        return {'result': None, 'error': repr(e), 'seconds': perf_counter() - started}
+
+
+class MultiStoreRunner:
+    """Runs the same job against many stores concurrently, in a thread or process pool.
+    Requests to different stores use different cost buckets (see
+    ``throttle.shared_bucket``), so every store is throttled by its own budget. The
+    results are aggregated per store with timing and failure information.
+
+    Usage:
+
+    #def handle_to_id(store):
+    #    return Metafields(csv_path, tag='summer', store=store).product_handle_to_id()
+    #results = MultiStoreRunner([Store('shop-a', ...), Store('shop-b', ...)]).run(handle_to_id)
+    """
+
+    def __init__(self, stores, max_workers=None, processes=False):
+        """Constructor
+
+        Args:
+            stores (list): ``Store`` credentials
+            max_workers (int, optional): Stores processed at a time. Defaults to one
+                worker per store.
+            processes (bool, optional): Use a process pool instead of threads, the job
+                must be picklable (a module level function). Defaults to False.
+        """
+        self.log = logger.configure("default")
+        self._stores = stores
+        self._max_workers = max_workers or len(stores)
+        self._processes = processes
+
+    def run(self, job):
+        """Run ``job(store)`` for every store
+
+        Args:
+            job (callable): Job, called with a ``Store``
+
+        Returns:
+            dict: with key: store name, value: dict with ``result``, ``error`` and ``seconds``
+        """
+        executor = ProcessPoolExecutor if self._processes else ThreadPoolExecutor
+        results = {}
+        with executor(max_workers=self._max_workers) as pool:
+            futures = {pool.submit(_timed, job, store): store for store in self._stores}
+            for future in as_completed(futures):
+                store = futures[future]
+                results[store.name] = result = future.result()
+                if result['error']:
+                    self.log.error('Job failed for store {} after {:.1f}s: {}'\
+                        .format(store.name, result['seconds'], result['error']))
+                else:
+                    self.log.info('Job done for store {} in {:.1f}s'.format(store.name, result['seconds']))
+        self.log.info(self.summary(results))
+        return results
+
+    def summary(self, results):
+        """Return a one line summary of the results of ``run()``
+
+        Args:
+            results (dict): Results by store name
+
+        Returns:
+            str: Summary
+        """
+        failed = sorted(name for name, result in results.items() if result['error'])
+        slowest = max(results.items(), key=lambda item: item[1]['seconds'], default=(None, None))
+        return '{} stores, {} failed {}, slowest: {} ({:.1f}s)'.format(
+            len(results), len(failed), failed, slowest[0],
+            slowest[1]['seconds'] if slowest[1] else 0.0)
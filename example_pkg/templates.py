@@ -0,0 +1,84 @@
+import json
+import re
+from functools import lru_cache
+
+_VARIABLE = re.compile(r'\$(\w+)\s*:\s*([\w\[\]!]+)')
+_WHITESPACE = re.compile(r'\s+')
+
+class QueryTemplate:
+    """GraphQL document which is validated and serialized once. Per request values are
+    passed as GraphQL ``variables`` and serialized with ``json.dumps``, so no values are
+    spliced into the document and no escaping is needed.
+
+    Usage:
+
+    #products = template('query($first: Int!, $after: String) { products(first: $first, after: $after) { ... } }')
+    #payload = products.payload(first=50, after=cursor)
+    """
+
+    def __init__(self, document):
+        """Constructor
+
+        Args:
+            document (str): GraphQL query or mutation
+
+        Raises:
+            ValueError: When brackets of the document are not balanced
+        """
+        self.document = _WHITESPACE.sub(' ', document).strip()
+        self._validate()
+        # name -> True if the variable is required (non-null type without default)
+        header = self.document.split('{', 1)[0]
+        self.variables = {name: type.endswith('!') for name, type in _VARIABLE.findall(header)}
+        self._prefix = '{"query": ' + json.dumps(self.document) + ', "variables": '
+
+    def __repr__(self):
+        return 'QueryTemplate({!r})'.format(self.document)
+
+    def _validate(self):
+        pairs = {'}': '{', ')': '(', ']': '['}
+        stack = []
+        in_string = False
+        for char in self.document:
+            if char == '"':
+                in_string = not in_string
+            elif in_string:
+                continue
+            elif char in '{([':
+                stack.append(char)
+            elif char in pairs:
+                if not stack or stack.pop() != pairs[char]:
+                    raise ValueError('Unbalanced `{}` in GraphQL document: {}'.format(char, self.document))
+        if stack or in_string:
+            raise ValueError('Unterminated GraphQL document: {}'.format(self.document))
+
+    def payload(self, **variables):
+        """Return the JSON payload of a request
+
+        Raises:
+            ValueError: When a variable is not declared or a required one is missing
+
+        Returns:
+            str: ``{"query": ..., "variables": ...}``
+        """
+        for name in variables:
+            if name not in self.variables:
+                raise ValueError('Variable `{}` is not declared in {}'.format(name, self.document))
+        for name, required in self.variables.items():
+            if required and variables.get(name) is None:
+                raise ValueError('Required variable `{}` is missing'.format(name))
+        return self._prefix + json.dumps(variables) + '}'
+
+
+@lru_cache(maxsize=256)
+def template(document):
+    """Return the compiled template of a GraphQL document, every document is compiled
+    only once
+
+    Args:
+        document (str): GraphQL query or mutation
+
+    Returns:
+        QueryTemplate: Compiled template
+    """
+    return QueryTemplate(document)
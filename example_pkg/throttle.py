@@ -0,0 +1,168 @@
+import asyncio
+from threading import Condition, Lock
+from time import monotonic
+
+class CostBucket:
+    """Leaky bucket model of Shopify's GraphQL query cost limit. The bucket holds up to
+    ``maximumAvailable`` points and restores ``restoreRate`` points per second. Requests
+    are admitted *before* they are sent, based on their expected (requested) cost, and
+    the bucket is corrected with the ``extensions.cost.throttleStatus`` of every
+    response. The bucket is thread safe, several ``GraphQL`` instances and threads
+    sharing one bucket run at the actual rate limit of the store.
+
+    Usage:
+
+    #bucket = CostBucket()
+    #cost = bucket.acquire(52)
+    #... send request ...
+    #bucket.settle(cost, response.json()['extensions']['cost']['throttleStatus'])
+    """
+
+    def __init__(self, maximum_available=1000, restore_rate=50, clock=monotonic):
+        """Constructor
+
+        Args:
+            maximum_available (int, optional): Bucket size in cost points. Defaults to 1000.
+            restore_rate (int, optional): Restored cost points per second. Defaults to 50.
+            clock (callable, optional): Monotonic clock in seconds. Defaults to time.monotonic.
+        """
+        self._maximum_available = float(maximum_available)
+        self._restore_rate = float(restore_rate)
+        self._available = float(maximum_available)
+        self._in_flight = 0.0
+        self._clock = clock
+        self._updated = clock()
+        self._condition = Condition(Lock())
+
+    def _restore(self):
+        now = self._clock()
+        self._available = min(self._maximum_available,
+                              self._available + (now - self._updated) * self._restore_rate)
+        self._updated = now
+
+    def available(self):
+        """Return the currently available cost points
+
+        Returns:
+            float: Available cost points
+        """
+        with self._condition:
+            self._restore()
+            return self._available
+
+    def wait_time(self, cost):
+        """Return the time until a request of ``cost`` points would be admitted
+
+        Args:
+            cost (int): Requested query cost
+
+        Returns:
+            float: Seconds to wait, 0.0 if the request can be sent right away
+        """
+        with self._condition:
+            self._restore()
+            return self._wait_time(cost)
+
+    def _wait_time(self, cost):
+        cost = min(cost, self._maximum_available)
+        if self._available >= cost:
+            return 0.0
+        return (cost - self._available) / self._restore_rate
+
+    def acquire(self, cost):
+        """Block until ``cost`` points are available and reserve them
+
+        Args:
+            cost (int): Requested query cost
+
+        Returns:
+            float: Reserved cost points, to be passed to ``settle()``
+        """
+        with self._condition:
+            while True:
+                self._restore()
+                time_to_wait = self._wait_time(cost)
+                if not time_to_wait:
+                    break
+                self._condition.wait(time_to_wait)
+            self._available -= cost
+            self._in_flight += cost
+            return cost
+
+    async def acquire_async(self, cost):
+        """Like ``acquire()``, but awaits the restore of the bucket instead of blocking
+        the thread, for requests sent from an asyncio event loop
+
+        Args:
+            cost (int): Requested query cost
+
+        Returns:
+            float: Reserved cost points, to be passed to ``settle()``
+        """
+        while True:
+            with self._condition:
+                self._restore()
+                time_to_wait = self._wait_time(cost)
+                if not time_to_wait:
+                    self._available -= cost
+                    self._in_flight += cost
+                    return cost
+            await asyncio.sleep(time_to_wait)
+
+    def settle(self, reserved, throttle_status=None):
+        """Release a reservation and synchronize the bucket with the throttle status
+        reported by Shopify
+
+        Args:
+            reserved (float): Cost points returned by ``acquire()``
+            throttle_status (dict, optional): ``extensions.cost.throttleStatus`` of the
+                response. Defaults to None.
+        """
+        with self._condition:
+            self._in_flight = max(0.0, self._in_flight - reserved)
+            self._restore()
+            if throttle_status:
+                self._maximum_available = float(throttle_status['maximumAvailable'])
+                self._restore_rate = float(throttle_status['restoreRate'])
+                # Shopify doesn't know about requests which are still in flight
+                self._available = float(throttle_status['currentlyAvailable']) - self._in_flight
+            self._condition.notify_all()
+
+
+_buckets = {}
+_buckets_lock = Lock()
+
+def shared_bucket(key, maximum_available=1000, restore_rate=50):
+    """Return the process wide bucket of a store, create it on first use
+
+    Args:
+        key (str): Store identifier, e.g. the GraphQL API URL
+        maximum_available (int, optional): Bucket size of a new bucket. Defaults to 1000.
+        restore_rate (int, optional): Restore rate of a new bucket. Defaults to 50.
+
+    Returns:
+        CostBucket: Bucket shared by all requests to the store
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = CostBucket(maximum_available, restore_rate)
+        return bucket
+
+def call_limit_status(header, restore_rate=2):
+    """Convert the REST ``X-Shopify-Shop-Api-Call-Limit`` header (e.g. ``32/40``) to a
+    throttle status for ``CostBucket.settle()``, each call costs one point
+
+    Args:
+        header (str): Header value, ``used/limit``
+        restore_rate (int, optional): Calls leaking per second, not part of the header.
+            Defaults to 2.
+
+    Returns:
+        dict: Throttle status, None if the header is missing or invalid
+    """
+    try:
+        used, limit = (int(number) for number in header.split('/'))
+    except (AttributeError, ValueError):
+        return None
+    return {'maximumAvailable': limit, 'currentlyAvailable': limit - used, 'restoreRate': restore_rate}
@@ -0,0 +1,167 @@
+import json
+import os
+from collections import defaultdict, deque
+from threading import Lock
+from time import sleep
+from connection import default_pool
+from throttle import CostBucket
+import logger
+
+class RecordingTransport:
+    """Transport which sends requests through ``inner`` and records every exchange
+    (request, status, headers including throttle headers, body including
+    ``extensions.cost``) as a JSON line. Pass it as ``session_pool`` to ``GraphQL`` or
+    ``REST``.
+
+    Usage:
+
+    #transport = RecordingTransport('fixtures/products.jsonl')
+    #GraphQL(url=url, headers=headers, payload=payload, session_pool=transport).data()
+    """
+
+    def __init__(self, path, inner=None):
+        """Constructor
+
+        Args:
+            path (str): JSON lines file the exchanges are appended to
+            inner (SessionPool, optional): Transport sending the requests. Defaults to the
+                shared pool of the process.
+        """
+        self.log = logger.configure("default")
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._path = path
+        self._inner = inner or default_pool()
+        self._lock = Lock()
+
+    def request(self, method, url, **kwargs):
+        response = self._inner.request(method, url, **kwargs)
+        exchange = {
+            'method': method,
+            'url': url,
+            'data': kwargs.get('data'),
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'body': response.content.decode('utf-8'),
+        }
+        # the body was decoded by requests already
+        exchange['headers'].pop('Content-Encoding', None)
+        with self._lock, open(self._path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(exchange) + '\n')
+        return response
+
+    def close(self):
+        self._inner.close()
+
+
+class ReplayTransport:
+    """Transport which serves recorded exchanges (see ``RecordingTransport``) without
+    network access. Exchanges are matched by method, URL and body, or only by method
+    and URL in recording order if ``match_body`` is False. Supports a simulated
+    latency and a simulated GraphQL cost bucket: when ``cost_limit`` is set,
+    ``throttleStatus`` of the replayed responses is rewritten from a local leaky bucket
+    and requests exceeding it get a ``THROTTLED`` error.
+
+    Usage:
+
+    #transport = ReplayTransport('fixtures/products.jsonl', latency=0.05, cost_limit=1000)
+    #GraphQL(url=url, headers=headers, payload=payload, session_pool=transport).data()
+    """
+
+    def __init__(self, path=None, exchanges=None, match_body=True, cycle=False, latency=0.0,
+                 cost_limit=None, restore_rate=50):
+        """Constructor
+
+        Args:
+            path (str, optional): JSON lines file written by ``RecordingTransport``. Defaults to None.
+            exchanges (list, optional): Exchanges as dicts, instead of a file. Defaults to None.
+            match_body (bool, optional): Match requests by body too. Defaults to True.
+            cycle (bool, optional): Serve the exchanges of a request again when they are
+                used up. Defaults to False.
+            latency (float, optional): Simulated seconds per request. Defaults to 0.0.
+            cost_limit (int, optional): Size of the simulated GraphQL cost bucket, no
+                simulation if None. Defaults to None.
+            restore_rate (int, optional): Restore rate of the simulated bucket. Defaults to 50.
+        """
+        self.log = logger.configure("default")
+        if path:
+            with open(path, encoding='utf-8') as f:
+                exchanges = [json.loads(line) for line in f if line.strip()]
+        self._match_body = match_body
+        self._cycle = cycle
+        self._latency = latency
+        self._bucket = CostBucket(cost_limit, restore_rate) if cost_limit else None
+        self._cost_limit = cost_limit
+        self._restore_rate = restore_rate
+        self._exchanges = defaultdict(deque)
+        for exchange in exchanges or []:
+            self._exchanges[self._key(exchange['method'], exchange['url'], exchange.get('data'))]\
+                .append(exchange)
+        self._lock = Lock()
+        self.requests = 0
+
+    def _key(self, method, url, data):
+        return (method, url, data) if self._match_body else (method, url)
+
+    def request(self, method, url, **kwargs):
+        key = self._key(method, url, kwargs.get('data'))
+        with self._lock:
+            self.requests += 1
+            queue = self._exchanges.get(key)
+            if not queue:
+                raise LookupError('No recorded exchange for {} {}'.format(method, url))
+            body, throttled = queue[0]['body'], False
+            if self._bucket:
+                body, throttled = self._simulate_cost(body)
+            if throttled:
+                # a throttled request doesn't use up the exchange, the retry gets the same page
+                exchange = queue[0]
+            else:
+                exchange = queue.popleft()
+                if self._cycle:
+                    queue.append(exchange)
+        if self._latency:
+            sleep(self._latency)
+        return self._response(exchange, body)
+
+    def _simulate_cost(self, body):
+        """Return the body with the ``throttleStatus`` of the simulated bucket, or a
+        ``THROTTLED`` error if the bucket can't admit the requested cost
+
+        Returns:
+            tuple: ``(body, throttled)``
+        """
+        try:
+            data = json.loads(body)
+            cost = data['extensions']['cost']
+        except (ValueError, KeyError, TypeError):
+            return body, False
+        requested = cost['requestedQueryCost']
+        throttled = bool(self._bucket.wait_time(requested))
+        if throttled:
+            available = self._bucket.available()
+            data = {'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}]}
+        else:
+            self._bucket.settle(self._bucket.acquire(cost.get('actualQueryCost', requested)))
+            available = self._bucket.available()
+        data['extensions'] = {'cost': dict(cost, throttleStatus={
+            'maximumAvailable': self._cost_limit,
+            'currentlyAvailable': int(available),
+            'restoreRate': self._restore_rate})}
+        return json.dumps(data), throttled
+
+    def _response(self, exchange, body):
+        from requests.models import Response
+        from requests.structures import CaseInsensitiveDict
+        response = Response()
+        response.status_code = exchange['status_code']
+        response.headers = CaseInsensitiveDict(exchange.get('headers') or {})
+        response.url = exchange['url']
+        response.encoding = 'utf-8'
+        response._content = body.encode('utf-8')
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
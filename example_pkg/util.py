@@ -1,5 +1,4 @@
 from datetime import datetime, timedelta
-import yaml
 import logger
 import os
 import json
@@ -33,16 +32,11 @@ class GraphqlQueryString:
 
 
 def config():
-    """Provides configuration parameters, store information, api_keys
+    """Provides configuration parameters, store information, api_keys. The file is
+    parsed only once, see ``settings.Settings``.
     """
-    try:
-        with open("config.yml", 'r') as ymlfile:
-            return yaml.load(ymlfile, Loader=yaml.BaseLoader)
-    except FileNotFoundError:
-        logger = app_logger.configure('default')
-        logger.error('Could not find configuration file config.yml')
-    except:
-        logger.error('Invalid key request to config.yml')
+    from settings import settings
+    return settings().values()
 
 def last_day_of_month(any_datetime):
             next_month = any_datetime.replace(day=28) + timedelta(days=4) 
@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example_pkg'))
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # log files, error.log and SQLite state are written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from async_shopify import AsyncGraphQL
+from retry import RetryPolicy
+from throttle import CostBucket
+from transport import ReplayTransport
+
+URL = 'https://test.myshopify.com/admin/api/2021-01/graphql.json'
+
+def page(numbers, has_next, cursor=None):
+    edges = [{'cursor': cursor, 'node': {'id': 'gid://shopify/Product/{}'.format(number),
+                                         'handle': 'product-{}'.format(number)}}
+             for number in numbers]
+    body = {'data': {'products': {'edges': edges, 'pageInfo': {'hasNextPage': has_next}}},
+            'extensions': {'cost': {'requestedQueryCost': 10, 'actualQueryCost': 10, 'throttleStatus': {
+                'maximumAvailable': 1000.0, 'currentlyAvailable': 990, 'restoreRate': 50.0}}}}
+    return {'method': 'POST', 'url': URL, 'status_code': 200,
+            'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)}
+
+def server_error():
+    return {'method': 'POST', 'url': URL, 'status_code': 503, 'headers': {}, 'body': ''}
+
+def query(exchanges, bucket=None):
+    transport = ReplayTransport(exchanges=exchanges, match_body=False)
+    return AsyncGraphQL(URL, {}, '{{ products(first: 2{}) {{ edges {{ cursor node {{ id handle }} }} }} }}',
+                        query_filter='', session_pool=transport, bucket=bucket or CostBucket(),
+                        retry_policy=RetryPolicy(max_retries=3, backoff=0.01, max_wait=1)), transport
+
+@pytest.fixture
+def no_blocking_sleep(monkeypatch):
+    def sleep(seconds):
+        raise AssertionError('blocking sleep in the event loop')
+    monkeypatch.setattr('shopify.sleep', sleep)
+    monkeypatch.setattr('graphql.sleep', sleep)
+    monkeypatch.setattr('throttle.CostBucket.acquire', lambda self, cost: sleep(None))
+
+def test_retry_backoff_is_awaited(no_blocking_sleep):
+    shopify, transport = query([server_error(), page([1, 2], True, 'c2'), page([3], False)])
+    records = asyncio.run(shopify.data())
+    assert [record['node']['handle'] for record in records] == ['product-1', 'product-2', 'product-3']
+    assert transport.requests == 3
+
+def test_bucket_admission_is_awaited(no_blocking_sleep):
+    bucket = CostBucket()
+    # drained bucket, 10 points are restored after 0.01 seconds
+    bucket.settle(0, {'maximumAvailable': 1000, 'currentlyAvailable': 0, 'restoreRate': 1000})
+    shopify, _ = query([page([1], False)], bucket)
+    shopify._expected_cost = 10
+
+    assert len(asyncio.run(shopify.data())) == 1
+
+def test_data_with_fields_and_stream_to():
+    class Sink:
+        def __init__(self):
+            self.records = []
+        def write(self, records):
+            self.records.extend(records)
+        def flush(self):
+            pass
+
+    shopify, _ = query([page([1, 2], True, 'c2'), page([3], False)])
+    records = asyncio.run(shopify.data(fields=['node.id']))
+    assert records.column('node.id').numbers().tolist() == [1, 2, 3]
+
+    sink = Sink()
+    shopify, _ = query([page([1, 2], True, 'c2'), page([3], False)])
+    assert asyncio.run(shopify.stream_to(sink)) == 3
+    assert len(sink.records) == 3
+
+def test_thread_based_prefetch_is_not_available():
+    shopify, _ = query([page([1], False)])
+    with pytest.raises(NotImplementedError):
+        shopify.prefetch_session()
+    with pytest.raises(NotImplementedError):
+        shopify.pages(look_ahead=2)
@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from bulk_operation import BulkOperation, BulkOperationError
+from stores import Store
+from throttle import CostBucket
+from transport import ReplayTransport
+
+STORE = Store('test', 'password', '2021-01')
+URL = 'https://test.myshopify.com/admin/api/2021-01/graphql.json'
+RESULT_URL = 'https://storage.example.com/bulk/result.jsonl'
+OPERATION_ID = 'gid://shopify/BulkOperation/1'
+
+def graphql_exchange(data):
+    body = {'data': data, 'extensions': {'cost': {
+        'requestedQueryCost': 10, 'actualQueryCost': 10,
+        'throttleStatus': {'maximumAvailable': 1000.0, 'currentlyAvailable': 990,
+                           'restoreRate': 50.0}}}}
+    return {'method': 'POST', 'url': URL, 'status_code': 200,
+            'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)}
+
+def started(user_errors=()):
+    return graphql_exchange({'bulkOperationRunQuery': {
+        'bulkOperation': None if user_errors else {'id': OPERATION_ID, 'status': 'CREATED'},
+        'userErrors': list(user_errors)}})
+
+def current(status, url=None, error_code=None, object_count=0):
+    return graphql_exchange({'currentBulkOperation': {
+        'id': OPERATION_ID, 'status': status, 'errorCode': error_code,
+        'objectCount': object_count, 'url': url}})
+
+def result(nodes):
+    return {'method': 'GET', 'url': RESULT_URL, 'status_code': 200,
+            'headers': {'Content-Type': 'application/jsonl'},
+            'body': ''.join(json.dumps(node) + '\n' for node in nodes)}
+
+def bulk_operation(exchanges, poll_interval=0, timeout=None):
+    transport = ReplayTransport(exchanges=exchanges, match_body=False)
+    operation = BulkOperation(URL, {}, '{ products { edges { node { id handle } } } }',
+                              poll_interval=poll_interval, timeout=timeout,
+                              session_pool=transport, store=STORE)
+    return operation, transport
+
+@pytest.fixture(autouse=True)
+def bucket(monkeypatch):
+    # don't share the process wide cost bucket between tests
+    monkeypatch.setattr('graphql.shared_bucket', lambda *args: CostBucket())
+
+def test_start_poll_and_stream_records():
+    nodes = [{'id': 'gid://shopify/Product/{}'.format(i), 'handle': 'product-{}'.format(i)}
+             for i in range(3)]
+    operation, transport = bulk_operation([
+        started(), current('RUNNING'), current('RUNNING', object_count=2),
+        current('COMPLETED', url=RESULT_URL, object_count=3), result(nodes)])
+
+    assert operation.data() == [{'node': node} for node in nodes]
+    assert transport.requests == 5
+
+def test_completed_without_results():
+    operation, _ = bulk_operation([started(), current('COMPLETED')])
+    assert operation.data() == []
+
+def test_stream_to_flushes_chunks():
+    nodes = [{'id': 'gid://shopify/Product/{}'.format(i)} for i in range(5)]
+    operation, _ = bulk_operation([started(), current('COMPLETED', url=RESULT_URL), result(nodes)])
+
+    class Sink:
+        def __init__(self):
+            self.chunks = []
+
+        def write(self, records):
+            self.chunks.append(list(records))
+
+        def flush(self):
+            pass
+
+    sink = Sink()
+    assert operation.stream_to(sink, chunk_size=2) == 5
+    assert [len(chunk) for chunk in sink.chunks] == [2, 2, 1]
+
+def test_start_with_user_errors_raises():
+    operation, _ = bulk_operation([started([{'field': None, 'message': 'already in progress'}])])
+    with pytest.raises(BulkOperationError, match='already in progress'):
+        operation.start()
+
+def test_failed_operation_raises():
+    operation, _ = bulk_operation([started(), current('FAILED', error_code='INTERNAL_SERVER_ERROR')])
+    with pytest.raises(BulkOperationError, match='INTERNAL_SERVER_ERROR'):
+        operation.data()
+
+def test_timeout_raises():
+    operation, _ = bulk_operation([started()] + [current('RUNNING')] * 50,
+                                  poll_interval=0.01, timeout=0.05)
+    with pytest.raises(BulkOperationError, match='not finished'):
+        operation.data()
+
+def test_top_level_errors_raise():
+    errors = [{'message': 'Access denied for bulkOperationRunQuery field.',
+               'extensions': {'code': 'ACCESS_DENIED'}}]
+    exchange = graphql_exchange(None)
+    exchange['body'] = json.dumps({'data': None, 'errors': errors})
+    operation, _ = bulk_operation([exchange])
+    with pytest.raises(BulkOperationError, match='Access denied') as raised:
+        operation.start()
+    assert raised.value.errors == errors
+
+def test_no_current_operation_raises():
+    operation, _ = bulk_operation([started(), graphql_exchange({'currentBulkOperation': None})])
+    with pytest.raises(BulkOperationError, match='No current bulk operation'):
+        operation.data()
+
+def test_nested_connection_nodes_are_added_to_their_parent():
+    product = 'gid://shopify/Product/{}'.format
+    variant = 'gid://shopify/ProductVariant/{}'.format
+    lines = [{'id': product(1)}, {'id': variant(11), '__parentId': product(1)},
+             {'id': variant(12), '__parentId': product(1)}, {'id': product(2)}]
+    transport = ReplayTransport(exchanges=[started(), current('COMPLETED', url=RESULT_URL), result(lines)],
+                                match_body=False)
+    operation = BulkOperation(URL, {}, '{ products { edges { node { id variants { edges { node { id } } } } } } }',
+                              poll_interval=0, session_pool=transport, store=STORE)
+
+    assert operation.data() == [
+        {'node': {'id': product(1), 'variants': {'edges': [{'node': {'id': variant(11)}},
+                                                           {'node': {'id': variant(12)}}]}}},
+        {'node': {'id': product(2), 'variants': {'edges': []}}},
+    ]
+
+def test_more_than_one_nested_connection_is_rejected():
+    with pytest.raises(ValueError, match='variants, images'):
+        BulkOperation(URL, {}, '{ products { edges { node { id variants { edges { node { id } } } '
+                               'images { edges { node { id } } } } } } }', store=STORE)
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from checkpoint import CheckpointStore, IncrementalSync
+from graphql import GraphQL
+from throttle import CostBucket
+from transport import ReplayTransport
+
+URL = 'https://test.myshopify.com/admin/api/2021-01/graphql.json'
+STORE, QUERY = 'test', 'products'
+
+def page(handles, has_next):
+    edges = [{'cursor': 'cursor-' + handle, 'node': {'handle': handle, 'updatedAt': '2021-01-01T00:00:00Z'}}
+             for handle in handles]
+    body = {'data': {'products': {'edges': edges, 'pageInfo': {'hasNextPage': has_next}}}}
+    return {'method': 'POST', 'url': URL, 'status_code': 200,
+            'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)}
+
+class Requests:
+    """``request`` callable of ``IncrementalSync`` serving replayed pages"""
+
+    def __init__(self, exchanges):
+        self.transport = ReplayTransport(exchanges=exchanges, match_body=False)
+        self.calls = []
+
+    def __call__(self, search, cursor):
+        self.calls.append((search, cursor))
+        return GraphQL(URL, {}, '{{ products(first: 2{}) {{ edges {{ cursor node {{ handle }} }} }} }}',
+                       query_filter='', cursor=cursor, session_pool=self.transport, bucket=CostBucket())
+
+@pytest.fixture
+def state(workdir):
+    state = CheckpointStore(str(workdir / 'state.sqlite'))
+    yield state
+    state.close()
+
+def test_interrupted_sync_resumes_after_the_last_committed_page(state):
+    # the second page is missing, the run fails after committing the first page
+    requests = Requests([page(['a', 'b'], True)])
+    with pytest.raises(LookupError):
+        IncrementalSync(state, STORE, QUERY, requests).run()
+    assert state.checkpoint(STORE, QUERY) == (None, 'cursor-b')
+    assert set(state.snapshot(STORE, QUERY)) == {'a', 'b'}
+
+    requests = Requests([page(['c'], False)])
+    snapshot = IncrementalSync(state, STORE, QUERY, requests).run()
+    assert requests.calls == [('', 'cursor-b')]
+    assert set(snapshot) == {'a', 'b', 'c'}
+
+    high_water_mark, cursor = state.checkpoint(STORE, QUERY)
+    assert high_water_mark and cursor is None
+
+def test_next_run_fetches_changes_since_the_high_water_mark(state):
+    IncrementalSync(state, STORE, QUERY, Requests([page(['a'], False)])).run()
+    high_water_mark, _ = state.checkpoint(STORE, QUERY)
+
+    requests = Requests([page(['a', 'd'], False)])
+    snapshot = IncrementalSync(state, STORE, QUERY, requests).run()
+    assert requests.calls == [("updated_at:>='{}'".format(high_water_mark), None)]
+    assert set(snapshot) == {'a', 'd'}
+
+def test_resumed_run_keeps_the_high_water_mark_of_its_first_page(state):
+    state.commit_page(STORE, QUERY, [('a', {})], 'cursor-a', '2021-01-01T00:00:00Z')
+    state.commit_page(STORE, QUERY, [('b', {})], 'cursor-b', '2021-01-02T00:00:00Z')
+    state.finish(STORE, QUERY)
+    assert state.checkpoint(STORE, QUERY) == ('2021-01-01T00:00:00Z', None)
+
+def test_reset_forces_a_full_sync(state):
+    IncrementalSync(state, STORE, QUERY, Requests([page(['a'], False)])).run()
+    state.reset(STORE, QUERY)
+    assert state.checkpoint(STORE, QUERY) == (None, None)
+    assert state.snapshot(STORE, QUERY) == {}
@@ -0,0 +1,11 @@
+from connection import SessionPool
+
+def test_pool_size_per_host():
+    pool = SessionPool(pool_maxsize=4, host_pool_maxsize={'big.myshopify.com': 32})
+    big = pool.session('https://big.myshopify.com/admin/api/2021-01/graphql.json')
+    small = pool.session('https://small.myshopify.com/admin/api/2021-01/graphql.json')
+
+    assert big.get_adapter('https://big.myshopify.com/')._pool_maxsize == 32
+    assert small.get_adapter('https://small.myshopify.com/')._pool_maxsize == 4
+    assert pool.session('https://big.myshopify.com/admin/api/2021-01/shop.json') is big
+    pool.close()
@@ -0,0 +1,20 @@
+import importlib.util
+import os
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks',
+                         'bench_import_time.py')
+
+def load_benchmark():
+    spec = importlib.util.spec_from_file_location('bench_import_time', BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_import_does_not_load_heavy_dependencies_and_stays_within_budget():
+    benchmark = load_benchmark()
+    # the fastest of three runs in a fresh interpreter, like the benchmark
+    times, total = min((benchmark.import_times(benchmark.MODULES) for _ in range(3)),
+                       key=lambda run: run[1])
+    assert sorted(name for name in benchmark.HEAVY if name in times) == []
+    assert set(benchmark.MODULES) <= set(times)
+    assert total / 1000 <= benchmark.BUDGET_MS
@@ -0,0 +1,81 @@
+import pytest
+
+from jobs import MutationJob, DONE, FAILED, PENDING
+from retry import RetryError
+
+class Crash(Exception):
+    pass
+
+@pytest.fixture
+def path(workdir):
+    return str(workdir / 'jobs.sqlite')
+
+def test_run_applies_all_items(path):
+    job = MutationJob(path, 'job', commit_every=3)
+    assert job.enqueue([{'id': i} for i in range(10)]) == 10
+    applied = []
+    status = job.run(lambda item, payload: applied.append(payload['id']) or [])
+    assert applied == list(range(10))
+    assert status == {PENDING: 0, DONE: 10, FAILED: 0}
+
+def test_resume_after_crash_skips_committed_items(path):
+    job = MutationJob(path, 'job', commit_every=2)
+    job.enqueue(range(1, 11))
+
+    def crash_at_seven(item, payload):
+        if item == 7:
+            raise Crash()
+        return []
+
+    with pytest.raises(Crash):
+        job.run(crash_at_seven)
+    assert job.status()[DONE] == 6
+    job.close()
+
+    resumed = MutationJob(path, 'job', commit_every=2)
+    assert resumed.enqueued()
+    applied = []
+    status = resumed.run(lambda item, payload: applied.append(item) or [])
+    assert applied == [7, 8, 9, 10]
+    assert status[DONE] == 10
+
+def test_enqueue_again_keeps_the_status_of_items(path):
+    job = MutationJob(path, 'job')
+    job.enqueue(['a', 'b'])
+    job.run(lambda item, payload: [])
+    job.enqueue(['a', 'b', 'c'])
+    assert job.status() == {PENDING: 1, DONE: 2, FAILED: 0}
+
+def test_failed_items_are_dead_lettered_and_redriven(path):
+    job = MutationJob(path, 'job', max_workers=2)
+    job.enqueue(['ok', 'user error', 'retries exhausted', 'ok'])
+
+    def handler(item, payload):
+        if payload == 'user error':
+            return [{'field': ['metafields'], 'message': 'invalid value'}]
+        if payload == 'retries exhausted':
+            raise RetryError('Request failed after 5 attempts', 'server', attempts=5)
+        return []
+
+    assert job.run(handler) == {PENDING: 0, DONE: 2, FAILED: 2}
+    dead_letters = job.dead_letters()
+    assert [(item, payload) for item, payload, _ in dead_letters] == \
+        [(2, 'user error'), (3, 'retries exhausted')]
+    assert dead_letters[1][2][0]['kind'] == 'server'
+
+    assert job.redrive() == 2
+    assert job.dead_letters() == []
+    redriven = []
+    assert job.run(lambda item, payload: redriven.append(item) or []) == \
+        {PENDING: 0, DONE: 4, FAILED: 0}
+    assert redriven == [2, 3]
+
+def test_jobs_sharing_a_file_are_independent(path):
+    first, second = MutationJob(path, 'first'), MutationJob(path, 'second')
+    first.enqueue([1, 2])
+    second.enqueue([3])
+    first.run(lambda item, payload: [])
+    assert second.status() == {PENDING: 1, DONE: 0, FAILED: 0}
+    second.reset()
+    assert not second.enqueued()
+    assert first.status()[DONE] == 2
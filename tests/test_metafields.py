@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from metafields import Metafields
+from queries import GetProductsMetafields
+from records import IdIndex
+from stores import Store
+from throttle import CostBucket
+from transport import ReplayTransport
+
+CSV = '''Handle,Title,metafields.global.color,metafields.global.size
+shirt,Shirt,red,
+shirt,Shirt variant,blue,XL
+pants,Pants,,32
+hat,Hat,  ,
+unknown,Unknown,green,S
+'''
+
+IDS = {'shirt': 'gid://shopify/Product/1', 'pants': 'gid://shopify/Product/2',
+       'hat': 'gid://shopify/Product/3'}
+
+@pytest.fixture
+def csv_path(workdir):
+    path = workdir / 'products.csv'
+    path.write_text(CSV)
+    return str(path)
+
+@pytest.mark.parametrize('ids', [IDS, IdIndex(IDS)], ids=['dict', 'IdIndex'])
+def test_metafield_records_skip_empty_cells_and_unknown_handles(csv_path, ids):
+    records = list(Metafields(csv_path, tag='').metafield_records(ids, chunksize=2))
+    assert records == [
+        {'id': 'gid://shopify/Product/1', 'namespace': 'global', 'key': 'color', 'value': 'red'},
+        {'id': 'gid://shopify/Product/2', 'namespace': 'global', 'key': 'size', 'value': '32'},
+    ]
+
+def test_changed_metafields_fetch_only_the_csv_metafields(csv_path, monkeypatch):
+    store = Store('test', 'password', '2021-01')
+    keys = [('global', 'color'), ('global', 'size')]
+    query = GetProductsMetafields(['gid://shopify/Product/1', 'gid://shopify/Product/2'], keys,
+                                  store=store)
+    # one point for the query, per product one for the product and one per metafield
+    assert query.requested_cost() == 1 + 2 * (1 + len(keys))
+    assert GetProductsMetafields.max_products(len(keys)) == 250
+    assert GetProductsMetafields.max_products(200) == 4
+
+    body = {'data': {'nodes': [
+        {'id': 'gid://shopify/Product/1', 'm0': {'value': 'red'}, 'm1': None},
+        {'id': 'gid://shopify/Product/2', 'm0': None, 'm1': {'value': '30'}}]}}
+    # matched by body: the request must be the query of the CSV metafields
+    transport = ReplayTransport(exchanges=[{
+        'method': 'POST', 'url': query.url(), 'data': query.payload(), 'status_code': 200,
+        'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body)}])
+    monkeypatch.setattr('shopify.default_pool', lambda: transport)
+    monkeypatch.setattr('graphql.shared_bucket', lambda *args: CostBucket())
+
+    metafields = Metafields(csv_path, tag='', store=store)
+    monkeypatch.setattr(metafields, 'ids', lambda: IDS)
+    assert list(metafields.changed_metafields()) == [
+        {'id': 'gid://shopify/Product/2', 'namespace': 'global', 'key': 'size', 'value': '32'}]
+    assert transport.requests == 1
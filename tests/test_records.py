@@ -0,0 +1,26 @@
+import pytest
+
+from records import IdIndex
+
+PAIRS = [('shirt', 'gid://shopify/Product/2'), ('pants', 'gid://shopify/Product/1'),
+         ('hat', 'gid://shopify/Variant/7'), ('odd', 'gid://shopify/Product/1?x=y'),
+         ('shirt', 'gid://shopify/Product/3')]
+
+def test_id_index_last_duplicate_wins():
+    index = IdIndex(PAIRS)
+    assert len(index) == 4
+    assert index['shirt'] == 'gid://shopify/Product/3'
+    assert index.get('socks') is None
+
+def test_items_is_a_reusable_view():
+    items = IdIndex(PAIRS).items()
+    assert len(items) == 4
+    assert list(items) == list(items) == sorted(dict(PAIRS).items())
+    assert ('hat', 'gid://shopify/Variant/7') in items
+
+def test_lookup_matches_get():
+    pytest.importorskip('numpy')
+    index = IdIndex(PAIRS)
+    keys = ['shirt', 'socks', 'odd', 'hat', 'aaa', 'zzz', 'pants']
+    assert list(index.lookup(keys)) == [index.get(key) for key in keys]
+    assert list(IdIndex().lookup(['shirt'])) == [None]
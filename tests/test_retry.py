@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from graphql import GraphQL
+from response import ParsedResponse
+from retry import CLIENT, NETWORK, SERVER, THROTTLED, RetryError, RetryPolicy
+from throttle import CostBucket
+from transport import ReplayTransport
+
+URL = 'https://test.myshopify.com/admin/api/2021-01/graphql.json'
+
+def exchange(status_code=200, headers=None, body=None):
+    return {'method': 'POST', 'url': URL, 'status_code': status_code,
+            'headers': dict({'Content-Type': 'application/json'}, **(headers or {})),
+            'body': json.dumps(body if body is not None else {'data': {'shop': {'name': 'test'}}})}
+
+def throttled(requested=100, available=20, restore_rate=40):
+    return exchange(body={'errors': [{'message': 'Throttled', 'extensions': {'code': 'THROTTLED'}}],
+                          'extensions': {'cost': {'requestedQueryCost': requested, 'actualQueryCost': None,
+                                                  'throttleStatus': {'maximumAvailable': 1000.0,
+                                                                     'currentlyAvailable': available,
+                                                                     'restoreRate': restore_rate}}}})
+
+def response(recorded):
+    replay = ReplayTransport(exchanges=[recorded], match_body=False)
+    return ParsedResponse(replay.request('POST', URL))
+
+@pytest.fixture
+def policy():
+    return RetryPolicy(max_retries=5, backoff=1, max_wait=60, jitter=0)
+
+@pytest.fixture
+def waits(monkeypatch):
+    waits = []
+    monkeypatch.setattr('shopify.sleep', waits.append)
+    return waits
+
+def request(exchanges, policy):
+    transport = ReplayTransport(exchanges=exchanges, match_body=False)
+    shopify = GraphQL(URL, {}, '{ shop { name } }', session_pool=transport, bucket=CostBucket(),
+                      retry_policy=policy)
+    return shopify.api_request('POST', URL, data='{}', headers={}), transport
+
+def test_429_waits_for_retry_after(policy):
+    assert policy.classify(response(exchange(429, {'Retry-After': '2.5'}))) == (THROTTLED, 2.5)
+
+def test_429_waits_for_the_call_limit_to_leak(policy):
+    # 2 calls over the limit leak at 2 calls per second
+    assert policy.classify(response(exchange(429, {'X-Shopify-Shop-Api-Call-Limit': '41/40'}))) == (THROTTLED, 1.0)
+
+def test_throttled_graphql_error_in_200_waits_for_the_requested_cost(policy):
+    # (100 requested - 20 available) / 40 restored per second
+    assert policy.classify(response(throttled())) == (THROTTLED, 2.0)
+
+def test_classify(policy):
+    assert policy.classify(error=OSError('reset')) == (NETWORK, None)
+    assert policy.classify(response(exchange(503))) == (SERVER, None)
+    assert policy.classify(response(exchange(404))) == (CLIENT, None)
+    assert policy.classify(response(exchange())) == (None, None)
+    assert not policy.retryable(CLIENT)
+
+def test_backoff_doubles(policy):
+    assert [policy.wait_time(attempt) for attempt in range(3)] == [1, 2, 4]
+    assert policy.wait_time(3, hint=0.5) == 0.5
+
+def test_throttled_request_is_retried_after_the_demanded_wait(policy, waits):
+    result, transport = request([exchange(429, {'Retry-After': '3'}), throttled(), exchange()], policy)
+    assert result.json()['data'] == {'shop': {'name': 'test'}}
+    assert waits == [3.0, 2.0]
+    assert transport.requests == 3
+
+def test_client_error_is_not_retried(policy, waits):
+    with pytest.raises(RetryError) as raised:
+        request([exchange(403), exchange()], policy)
+    assert raised.value.kind == CLIENT
+    assert raised.value.attempts == 1
+    assert waits == []
+
+def test_max_wait_caps_the_total_wait(waits):
+    policy = RetryPolicy(max_retries=10, backoff=1, max_wait=5, jitter=0)
+    with pytest.raises(RetryError) as raised:
+        request([exchange(503)] * 10, policy)
+    # 1 + 2 seconds waited, another 4 seconds would exceed max_wait
+    assert waits == [1, 2]
+    assert raised.value.kind == SERVER
+    assert raised.value.attempts == 3
+
+def test_max_retries(waits):
+    policy = RetryPolicy(max_retries=2, backoff=1, max_wait=60, jitter=0)
+    with pytest.raises(RetryError) as raised:
+        request([exchange(503)] * 3, policy)
+    assert raised.value.attempts == 2
+    assert waits == [1]
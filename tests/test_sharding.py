@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sharding import created_at_ranges, id_ranges, updated_at_ranges
+
+def test_created_at_ranges_cover_the_keyspace():
+    assert created_at_ranges(datetime(2020, 1, 1), datetime(2020, 1, 4), 3) == [
+        "created_at:<'2020-01-02T00:00:00Z'",
+        "created_at:>='2020-01-02T00:00:00Z' created_at:<'2020-01-03T00:00:00Z'",
+        "created_at:>='2020-01-03T00:00:00Z'",
+    ]
+
+def test_id_ranges_cover_the_keyspace():
+    assert id_ranges(1000, 4000, 3) == ['id:<2000', 'id:>=2000 id:<3000', 'id:>=3000']
+    assert id_ranges(1000, 4000, 1) == ['']
+
+def test_updated_at_ranges():
+    assert updated_at_ranges(datetime(2020, 1, 1), datetime(2020, 1, 3), 2) == [
+        "updated_at:<'2020-01-02T00:00:00Z'", "updated_at:>='2020-01-02T00:00:00Z'"]
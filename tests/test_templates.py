@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from templates import QueryTemplate, template
+
+PRODUCTS = 'query($first: Int!, $after: String) { products(first: $first, after: $after) { edges { cursor } } }'
+
+def test_payload_passes_values_as_variables():
+    payload = json.loads(QueryTemplate(PRODUCTS).payload(first=50, after='abc'))
+    assert payload == {'query': PRODUCTS, 'variables': {'first': 50, 'after': 'abc'}}
+
+def test_values_are_escaped_by_json():
+    value = 'quote " backslash \\ brace } newline \n unicode é'
+    payload = json.loads(QueryTemplate(PRODUCTS).payload(first=1, after=value))
+    assert payload['variables']['after'] == value
+    assert payload['query'] == PRODUCTS
+
+def test_whitespace_is_normalized():
+    assert QueryTemplate('query {\n  shop {\n    name\n  }\n}').document == 'query { shop { name } }'
+
+def test_variables_and_required_flags():
+    assert QueryTemplate(PRODUCTS).variables == {'first': True, 'after': False}
+
+def test_missing_required_variable_raises():
+    with pytest.raises(ValueError, match='Required variable `first`'):
+        QueryTemplate(PRODUCTS).payload(after='abc')
+
+def test_undeclared_variable_raises():
+    with pytest.raises(ValueError, match='Variable `query` is not declared'):
+        QueryTemplate(PRODUCTS).payload(first=1, query='tag:summer')
+
+@pytest.mark.parametrize('document', ['{ shop { name }', '{ shop ( name } }', '{ shop { name ] }',
+                                      '{ products(query: "tag:summer) { id } }'])
+def test_unbalanced_documents_raise(document):
+    with pytest.raises(ValueError):
+        QueryTemplate(document)
+
+def test_brackets_in_strings_are_ignored():
+    assert QueryTemplate('{ products(query: "title:{") { edges { cursor } } }')
+
+def test_template_is_compiled_once():
+    assert template(PRODUCTS) is template(PRODUCTS)
@@ -0,0 +1,58 @@
+import pytest
+
+from throttle import CostBucket, call_limit_status
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def test_acquire_admits_while_points_are_available(clock):
+    bucket = CostBucket(1000, 50, clock=clock)
+    assert bucket.acquire(400) == 400
+    assert bucket.acquire(400) == 400
+    assert bucket.available() == 200
+    assert bucket.wait_time(200) == 0.0
+
+def test_wait_time_until_the_cost_is_restored(clock):
+    bucket = CostBucket(1000, 50, clock=clock)
+    bucket.acquire(1000)
+    assert bucket.wait_time(100) == pytest.approx(2.0)
+    clock.now = 1.0
+    assert bucket.wait_time(100) == pytest.approx(1.0)
+    clock.now = 30.0
+    assert bucket.available() == 1000
+
+def test_cost_above_the_bucket_size_waits_for_a_full_bucket(clock):
+    bucket = CostBucket(1000, 50, clock=clock)
+    assert bucket.wait_time(5000) == 0.0
+    bucket.acquire(500)
+    assert bucket.wait_time(5000) == pytest.approx(10.0)
+
+def test_settle_synchronizes_with_throttle_status(clock):
+    bucket = CostBucket(1000, 50, clock=clock)
+    first = bucket.acquire(100)
+    bucket.acquire(200)
+    bucket.settle(first, {'maximumAvailable': 2000.0, 'currentlyAvailable': 1500,
+                          'restoreRate': 100.0})
+    # the second request is still in flight and not yet known to Shopify
+    assert bucket.available() == 1300
+    clock.now = 1.0
+    assert bucket.available() == 1400
+
+def test_settle_without_status_only_releases_the_reservation(clock):
+    bucket = CostBucket(1000, 50, clock=clock)
+    bucket.settle(bucket.acquire(300))
+    assert bucket.available() == 700
+
+def test_call_limit_status():
+    assert call_limit_status('32/40', restore_rate=4) == \
+        {'maximumAvailable': 40, 'currentlyAvailable': 8, 'restoreRate': 4}
+    assert call_limit_status(None) is None
+    assert call_limit_status('invalid') is None